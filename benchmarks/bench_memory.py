@@ -0,0 +1,46 @@
+"""Measure the memory held by loaded TODOs.
+
+Run with `python -m benchmarks.bench_memory [SIZE...]` from the repository
+root. The default sizes are 10k, 100k and 1M TODOs. Strings are built anew
+for every record, as they are when read from the data file.
+"""
+import datetime
+import sys
+import tracemalloc
+
+from todo.rule import TodoRule
+
+
+SIZES = [10000, 100000, 1000000]
+GROUPS = ["work", "home", "errands", "reading", "sport"]
+
+
+def load(n: int) -> list[TodoRule]:
+    start = datetime.date(2023, 1, 1).toordinal()
+    return [
+        TodoRule.from_fields(
+            i,
+            f"task {i}",
+            "".join(GROUPS[i % len(GROUPS)]),
+            datetime.date.fromordinal(start + i % 365) if i % 3 else None,
+            "",
+            "".join("completed" if i % 2 else "uncompleted"),
+        )
+        for i in range(1, n + 1)
+    ]
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or SIZES
+    print(f"{'tasks':>8}{'total (MB)':>12}{'bytes/task':>12}")
+    for n in sizes:
+        tracemalloc.start()
+        rules = load(n)
+        size, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"{n:>8}{size / 1e6:>12.1f}{size / len(rules):>12.0f}")
+        del rules
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""Compare parse_date against the previous chain of re.match calls.
+
+The chain column only classifies the input, while parse_date also builds the
+date, so the comparison is in favour of the chain. Run with `python -m benchmarks.bench_parser` from the repository root.
+"""
+import datetime
+import re
+import timeit
+
+from todo.parser import parse_date
+
+
+# The patterns parse_date used to try one after another
+CHAIN = [
+    (r"^\d{8}$", 0),
+    (r"^\d{4}-\d{1,2}-\d{1,2}$", 0),
+    (r"^\d{4}/\d{1,2}/\d{1,2}$", 0),
+    (r"^\d{3,4}$", 0),
+    (r"^\d{1,2}-\d{1,2}", 0),
+    (r"^\d{1,2}/\d{1,2}", 0),
+    (r"^\d+ days?$", re.IGNORECASE),
+    (r"^\d+ weeks?$", re.IGNORECASE),
+    (r"^\d+ months?$", re.IGNORECASE),
+    (r"^\d+d$", re.IGNORECASE),
+    (r"^\d+w$", re.IGNORECASE),
+    (r"^\d+m$", re.IGNORECASE),
+    (r"^yesterday$", re.IGNORECASE),
+    (r"^today$", re.IGNORECASE),
+    (r"^tomorrow$", re.IGNORECASE),
+]
+
+INPUTS = ["2023-05-30", "20230530", "5/30", "3 days", "2w", "tomorrow", "friday"]
+NUMBER = 20000
+
+
+def classify_by_chain(date_str: str) -> int:
+    for i, (pattern, flags) in enumerate(CHAIN):
+        if re.match(pattern, date_str, flags=flags):
+            return i
+    return len(CHAIN)
+
+
+def main():
+    today = datetime.date.today()
+    print(f"{'input':<12}{'chain (us)':>14}{'parse_date (us)':>18}")
+    for date_str in INPUTS:
+        chain = timeit.timeit(lambda: classify_by_chain(date_str), number=NUMBER)
+        # bypass the daily cache to measure the grammar itself
+        compiled = timeit.timeit(
+            lambda: parse_date.__wrapped__(date_str, today), number=NUMBER
+        )
+        print(
+            f"{date_str:<12}{chain / NUMBER * 1e6:>14.2f}"
+            f"{compiled / NUMBER * 1e6:>18.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
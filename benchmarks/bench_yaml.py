@@ -0,0 +1,70 @@
+"""Time saving and loading the YAML snapshot with libyaml and pure Python, and
+loading it with a pool of as many processes as there are CPUs.
+
+Run with `python -m benchmarks.bench_yaml [SIZE...]` from the repository root.
+The default sizes are 1k, 10k and 100k TODOs.
+"""
+import sys
+import tempfile
+import time
+from pathlib import Path
+import yaml
+
+from todo.parallel import load_files
+from todo.rule import TodoRule
+from todo.storage import Store
+
+
+SIZES = [1000, 10000, 100000]
+
+
+def records(n: int) -> list[TodoRule]:
+    return [
+        TodoRule.from_record(
+            {
+                "id": i,
+                "title": f"task {i}",
+                "group": f"group {i % 10}",
+                "due_date": f"2023-05-{i % 28 + 1:02}" if i % 3 else "",
+                "comment": "a comment\nof two lines" if i % 5 == 0 else "",
+                "status": "completed" if i % 2 else "uncompleted",
+            }
+        )
+        for i in range(1, n + 1)
+    ]
+
+
+def measure(store: Store, data: list[TodoRule]) -> tuple[float, float, float]:
+    start = time.perf_counter()
+    store.compact(data)
+    saved = time.perf_counter()
+    load_files([store.path], store.loader, workers=1)
+    loaded = time.perf_counter()
+    load_files([store.path], store.loader)
+    parallel = time.perf_counter()
+    return saved - start, loaded - saved, parallel - loaded
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or SIZES
+    implementations = [("python", yaml.SafeLoader, yaml.SafeDumper)]
+    if yaml.__with_libyaml__:
+        implementations.append(("libyaml", yaml.CSafeLoader, yaml.CSafeDumper))
+
+    print(
+        f"{'tasks':>8}{'yaml':>10}{'save (s)':>10}{'load (s)':>10}"
+        f"{'parallel (s)':>14}"
+    )
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in sizes:
+            data = records(n)
+            for name, loader, dumper in implementations:
+                store = Store(Path(tmp) / f"{name}.yaml")
+                store.loader = loader
+                store.dumper = dumper
+                save, load, parallel = measure(store, data)
+                print(f"{n:>8}{name:>10}{save:>10.3f}{load:>10.3f}{parallel:>14.3f}")
+
+
+if __name__ == "__main__":
+    main()
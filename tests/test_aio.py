@@ -0,0 +1,60 @@
+import asyncio
+import tempfile
+import unittest
+from pathlib import Path
+
+from todo.aio import AsyncManager
+from todo.manager import Manager
+from todo.rule import TodoRule
+
+
+class TestAsyncManager(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmp.name) / "data.yaml"
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def count_writes(self, manager: AsyncManager) -> list[int]:
+        store = manager.manager.store
+        writes = []
+        append = store.append
+
+        def counted(ops):
+            writes.append(len(ops))
+            append(ops)
+
+        store.append = counted
+        return writes
+
+    async def test_should_coalesce_writes(self):
+        async with AsyncManager(self.path, delay=0.01) as manager:
+            writes = self.count_writes(manager)
+            ids = await asyncio.gather(
+                *(manager.append(TodoRule(f"task {i}", "", "", "")) for i in range(5))
+            )
+            await manager.mark(ids[0], "completed")
+            self.assertEqual(writes, [])
+
+            await asyncio.sleep(0.05)
+            self.assertEqual(writes, [6])
+
+        loaded = Manager(self.path)
+        self.assertEqual(sorted(loaded.data), [1, 2, 3, 4, 5])
+        self.assertEqual(loaded.info(ids[0]).status, "completed")
+
+    async def test_should_save_on_close(self):
+        async with AsyncManager(self.path, delay=60) as manager:
+            await manager.append(TodoRule("task", "", "2023-05-30", ""))
+            result = await manager.instances("2023-05-30", "uncompleted")
+            self.assertEqual([rule.title for rule in result], ["task"])
+
+        self.assertEqual(Manager(self.path).info(1).title, "task")
+
+    async def test_should_raise_errors_of_manager(self):
+        async with AsyncManager(self.path) as manager:
+            with self.assertRaises(KeyError):
+                await manager.info(1)
+            with self.assertRaises(KeyError):
+                await manager.mark(1, "completed")
@@ -0,0 +1,104 @@
+import datetime
+import tempfile
+import unittest
+from pathlib import Path
+
+from todo.manager import Manager
+from todo.rule import TodoRule
+
+
+class TestArchive(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmp.name) / "data.yaml"
+        manager = Manager(self.path)
+        manager.extend(
+            [
+                TodoRule("Old report", "work", "2023-03-20", ""),
+                TodoRule("Buy milk", "", "", ""),
+                TodoRule("Dropped", "", "", ""),
+                TodoRule("Recent", "work", "2023-05-29", ""),
+                TodoRule("Stand-up", "work", "2023-04-03 every 1 week", ""),
+                TodoRule("Last report", "work", "2023-04-20", ""),
+            ]
+        )
+        for id in [1, 4, 5, 6]:
+            manager.mark(id, "completed")
+        manager.mark(3, "not-planed")
+        # a pending occurrence keeps the series in the data file
+        manager.mark(5, "uncompleted", datetime.date(2023, 4, 10))
+        manager.save()
+        self.assertEqual(manager.archive(datetime.date(2023, 5, 1)), 3)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def ids(self, rules):
+        return [rule.id for rule in rules]
+
+    def test_should_move_finished_todos_to_shards(self):
+        archive = Manager(self.path).store.archive
+        self.assertEqual(archive.select(), ["2023-03", "2023-04", "undated"])
+        self.assertEqual([r["id"] for r in archive.load("2023-04")], [6])
+        self.assertEqual(
+            self.ids(
+                TodoRule.from_record(r)
+                for r in Manager(self.path).store.load_snapshot()
+            ),
+            [2, 4, 5],
+        )
+
+        # never reused, even if the largest
+        manager = Manager(self.path)
+        self.assertEqual(manager.append(TodoRule("new", "", "", "")), 7)
+
+    def test_should_load_only_shards_a_command_may_show(self):
+        manager = Manager(self.path)
+        self.assertEqual(self.ids(manager.iter_instances(None, "uncompleted")), [2])
+        self.assertEqual(manager.shards, set())
+
+        result = manager.iter_query("due:2023-04 report", "completed")
+        self.assertEqual(self.ids(result), [6])
+        self.assertEqual(manager.shards, {"2023-04"})
+
+        result = manager.iter_instances(None, "completed")
+        self.assertEqual(self.ids(result), [4, 6, 5, 1])
+        self.assertEqual(self.ids(manager.iter_rules()), [1, 2, 3, 4, 5, 6])
+        self.assertEqual(Manager(self.path, lazy=True).info(3).title, "Dropped")
+
+    def test_should_restore_changed_todos(self):
+        manager = Manager(self.path, lazy=True)
+        manager.mark(1, "uncompleted")
+        manager.remove(3)
+        manager.save()
+
+        loaded = Manager(self.path)
+        self.assertEqual(self.ids(loaded.iter_instances(None, "uncompleted")), [2, 1])
+        self.assertEqual(loaded.store.archive.select(), ["2023-04"])
+        with self.assertRaises(KeyError):
+            loaded.info(3)
+
+        loaded.compact()
+        self.assertEqual(self.ids(Manager(self.path).iter_rules()), [1, 2, 4, 5, 6])
+
+    def test_should_archive_series_once_ended(self):
+        path = Path(self.tmp.name) / "series.yaml"
+        manager = Manager(path)
+        manager.append(TodoRule("Weekly", "", "2024-01-01 weekly until 2024-12-31", ""))
+        manager.mark(1, "completed")
+        self.assertEqual(manager.archive(datetime.date(2024, 7, 1)), 0)
+        self.assertEqual(manager.archive(datetime.date(2025, 1, 1)), 1)
+        self.assertEqual(manager.store.archive.select(), ["series"])
+
+        loaded = Manager(path)
+        result = loaded.iter_instances("2024-06-03", "completed")
+        self.assertEqual(self.ids(result), [1])
+        result = Manager(path).iter_query("due:2024-06", "completed")
+        self.assertEqual(len(list(result)), 4)
+        loaded = Manager(path)
+        self.assertEqual(list(loaded.iter_query("due:none", "completed")), [])
+        self.assertEqual(loaded.shards, set())
+
+
+if __name__ == "__main__":
+    unittest.main()
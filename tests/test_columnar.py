@@ -0,0 +1,57 @@
+import datetime
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from todo import columnar
+from todo.manager import Manager
+from todo.rule import TodoRule
+
+
+class TestTable(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.manager = Manager(Path(self.tmp.name) / "data.yaml")
+        for i in range(40):
+            due_date = f"2023-05-{i % 7 + 1:02}" if i % 3 else ""
+            self.manager.append(TodoRule(f"task {i}", f"group {i % 4}", due_date, ""))
+        for id in range(1, 41, 3):
+            self.manager.mark(id, "completed")
+        for id in range(2, 41, 5):
+            self.manager.mark(id, "not-planed")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def check(self):
+        table = self.manager.table()
+        for status in ["completed", "uncompleted", "not-planed"]:
+            for date in [None, "2023-05-03"]:
+                expected = [rule.id for rule in self.manager.instances(date, status)]
+                result = [rule.id for rule in table.instances(date, status)]
+                self.assertEqual(result, expected)
+
+        mask = table.mask(
+            "uncompleted",
+            datetime.date(2023, 5, 2),
+            datetime.date(2023, 5, 4),
+            "group 1",
+        )
+        expected = [
+            rule
+            for rule in self.manager.iter_range(
+                "uncompleted", datetime.date(2023, 5, 2), datetime.date(2023, 5, 4)
+            )
+            if rule.group == "group 1"
+        ]
+        self.assertEqual(table.count(mask), len(expected))
+        self.assertEqual(table.select(mask), expected)
+        self.assertEqual(table.count(table.mask(group="unknown")), 0)
+
+    def test_should_match_manager(self):
+        self.check()
+
+    def test_should_match_manager_without_numpy(self):
+        with mock.patch.object(columnar, "numpy", None):
+            self.check()
@@ -0,0 +1,107 @@
+import datetime
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from todo.daemon import Server, connect
+from todo.manager import Manager
+from todo.rule import TodoRule
+
+
+class TestDaemon(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp.name)
+        self.socket_path = self.dir / "todo.sock"
+        self.manager = Manager(self.dir / "data.yaml")
+        self.server = Server(self.manager, self.socket_path)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.thread.join()
+        self.server.server_close()
+        self.tmp.cleanup()
+
+    def test_should_forward_to_manager(self):
+        client = connect(self.socket_path)
+        assert client is not None
+        rule = TodoRule("remote", "group", "2023-05-30", "")
+        self.assertEqual(client.append(rule), 1)
+        client.mark(1, "completed")
+        client.save()
+
+        self.assertEqual(self.manager.info(1).status, "completed")
+        loaded = Manager(self.dir / "data.yaml")
+        self.assertEqual(loaded.info(1).title, "remote")
+        self.assertEqual(
+            [rule.id for rule in client.iter_instances(None, "completed")], [1]
+        )
+
+    def test_should_raise_errors_of_manager(self):
+        client = connect(self.socket_path)
+        assert client is not None
+        with self.assertRaises(KeyError):
+            client.info(1)
+        client.append(TodoRule("remote", "", "", ""))
+        with self.assertRaises(ValueError):
+            client.mark(1, "unknown")
+
+    def test_should_follow_the_date_across_requests(self):
+        client = connect(self.socket_path)
+        assert client is not None
+        client.append(TodoRule("remote", "work", "2023-05-30", ""))
+        with mock.patch("todo.daemon.datetime") as clock:
+            clock.date.today.return_value = datetime.date(2023, 5, 30)
+            self.assertEqual(client.groups()[0][2], 0)
+            self.assertEqual(
+                len(list(client.iter_instances("today", "uncompleted"))), 1
+            )
+            clock.date.today.return_value = datetime.date(2023, 5, 31)
+            self.assertEqual(client.groups()[0][2], 1)
+            self.assertEqual(
+                len(list(client.iter_instances("today", "uncompleted"))), 0
+            )
+
+    def test_should_discard_on_error(self):
+        with self.assertRaises(KeyError):
+            with connect(self.socket_path) as client:
+                client.append(TodoRule("remote", "", "", ""))
+                client.info(2)
+        self.assertFalse(self.manager.dirty)
+        self.assertEqual(list(self.manager.iter_rules()), [])
+
+    def test_should_keep_sessions_apart(self):
+        first = connect(self.socket_path)
+        second = connect(self.socket_path)
+        assert first is not None and second is not None
+        first.append(TodoRule("first", "", "", ""))
+
+        def other_session():
+            second.append(TodoRule("second", "", "", ""))
+            second.save()
+
+        thread = threading.Thread(target=other_session)
+        thread.start()
+        # the second session waits for the first one to end
+        thread.join(0.2)
+        self.assertTrue(thread.is_alive())
+        first.discard()
+        thread.join()
+
+        loaded = Manager(self.dir / "data.yaml")
+        self.assertEqual([rule.title for rule in loaded.iter_rules()], ["second"])
+
+    def test_should_see_writes_of_other_processes(self):
+        client = connect(self.socket_path)
+        assert client is not None
+        other = Manager(self.dir / "data.yaml")
+        other.append(TodoRule("direct", "", "", ""))
+        other.save()
+        self.assertEqual(client.info(1).title, "direct")
+
+    def test_should_not_connect_without_daemon(self):
+        self.assertIsNone(connect(self.dir / "missing.sock"))
@@ -0,0 +1,61 @@
+import datetime
+import io
+import unittest
+
+from todo.exchange import read_rules, write_rules
+from todo.rule import TodoRule
+
+
+class TestExchange(unittest.TestCase):
+    def rules(self):
+        first = TodoRule("first", "group", "2023-05-30", 'with "quotes",\nand lines')
+        first.id = 1
+        second = TodoRule("second", "", "", "", status="completed")
+        second.id = 2
+        third = TodoRule("third", "", "2023-05-01 every week until 2023-06-30", "")
+        third.id = 3
+        third.set_override(datetime.date(2023, 5, 8), "not-planed")
+        return [first, second, third]
+
+    def test_should_round_trip(self):
+        for format in ["jsonl", "csv"]:
+            f = io.StringIO(newline="")
+            self.assertEqual(write_rules(f, format, self.rules()), 3)
+            f.seek(0)
+            rules = list(read_rules(f, format))
+
+            self.assertEqual(len(rules), 3)
+            for rule, expected in zip(rules, self.rules()):
+                self.assertEqual(rule.id, 0)
+                rule.id = expected.id
+                self.assertEqual(rule.into_dict(), expected.into_dict())
+
+    def test_should_fill_missing_fields(self):
+        f = io.StringIO('{"title": "task", "due_date": "2023/5/30"}\n\n')
+        [rule] = read_rules(f, "jsonl")
+        self.assertEqual(rule.group, "")
+        self.assertEqual(rule.due_date, datetime.date(2023, 5, 30))
+        self.assertEqual(rule.status, "uncompleted")
+
+    def test_should_report_line_of_invalid_record(self):
+        f = io.StringIO('{"title": "task"}\n{"title": "task", "status": "done"}\n')
+        with self.assertRaisesRegex(ValueError, "line 2"):
+            list(read_rules(f, "jsonl"))
+        f = io.StringIO("title,due_date\ntask,tomorrow\n,\n")
+        with self.assertRaisesRegex(ValueError, "line 3"):
+            list(read_rules(f, "csv"))
+        with self.assertRaisesRegex(ValueError, "line 1"):
+            list(read_rules(io.StringIO("[1, 2]\n"), "jsonl"))
+
+    def test_should_reject_fields_of_wrong_type(self):
+        for record in [
+            '{"title": 123}',
+            '{"title": "task", "comment": 4.5}',
+            '{"title": "task", "group": 5}',
+            '{"title": "task", "due_date": "05-01 weekly", "overrides": [1]}',
+            '{"title": "task", "color": "red"}',
+        ]:
+            f = io.StringIO('{"title": "task"}\n' + record + "\n")
+            with self.subTest(record=record):
+                with self.assertRaisesRegex(ValueError, "line 2"):
+                    list(read_rules(f, "jsonl"))
@@ -0,0 +1,98 @@
+import datetime
+import tempfile
+import unittest
+from pathlib import Path
+
+from todo.groups import GroupTree
+from todo.manager import Manager
+from todo.rule import TodoRule
+from todo.sqlite import SqliteManager
+from todo.utils import freeze_today
+
+
+RULES = [
+    TodoRule("Write report", "work", "2023-05-20", ""),
+    TodoRule("Migrate db", "work/infra/db", "2023-05-01", ""),
+    TodoRule("Renew certs", "work/infra", "2023-07-01", ""),
+    TodoRule("Buy milk", "", "", ""),
+    TodoRule("Stand-up", "work/team", "2023-05-29 every 1 day", ""),
+]
+
+
+class TestGroupTree(unittest.TestCase):
+    def test_should_aggregate_subtrees(self):
+        tree = GroupTree(RULES)
+        summary = tree.summary(datetime.date(2023, 5, 30))
+        self.assertEqual(
+            [
+                (group, counts["uncompleted"], overdue)
+                for group, counts, overdue in summary
+            ],
+            [
+                ("", 1, 0),
+                ("work", 4, 3),
+                ("work/infra", 2, 1),
+                ("work/infra/db", 1, 1),
+                ("work/team", 1, 1),
+            ],
+        )
+
+        tree.discard(RULES[1])
+        self.assertEqual(
+            [group for group, _, _ in tree.summary(datetime.date(2023, 5, 30))],
+            ["", "work", "work/infra", "work/team"],
+        )
+
+
+class TestManagerGroups(unittest.TestCase):
+    def setUp(self):
+        freeze_today(datetime.date(2023, 5, 30))
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmp.name) / "data.yaml"
+
+    def tearDown(self):
+        freeze_today(None)
+        self.tmp.cleanup()
+
+    def mutate(self, manager):
+        manager.mark(1, "completed")
+        manager.mark(5, "completed", datetime.date(2023, 5, 29))
+        manager.update(3, TodoRule("Renew certs", "home", "2023-05-02", ""))
+        manager.remove(4)
+
+    def test_should_keep_aggregates_up_to_date(self):
+        manager = Manager(self.path)
+        manager.extend(TodoRule.from_record(rule.into_dict()) for rule in RULES)
+        manager.compact()
+        self.assertTrue(manager.store.groups_path.exists())
+
+        loaded = Manager(self.path, lazy=True)
+        self.assertIsNotNone(loaded.group_tree)
+        self.mutate(loaded)
+        loaded.save()
+        expected = GroupTree(Manager(self.path).iter_rules()).summary(
+            datetime.date(2023, 5, 30)
+        )
+        self.assertEqual(loaded.groups(), expected)
+        # the aggregates of the snapshot, caught up with the journal
+        self.assertEqual(Manager(self.path, lazy=True).groups(), expected)
+        self.assertEqual(
+            [(group, overdue) for group, _, overdue in expected],
+            [
+                ("home", 1),
+                ("work", 1),
+                ("work/infra", 1),
+                ("work/infra/db", 1),
+                ("work/team", 0),
+            ],
+        )
+
+        sqlite = SqliteManager(Path(self.tmp.name) / "data.sqlite3")
+        sqlite.extend(TodoRule.from_record(rule.into_dict()) for rule in RULES)
+        self.mutate(sqlite)
+        self.assertEqual(sqlite.groups(), expected)
+        sqlite.conn.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
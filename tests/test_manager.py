@@ -0,0 +1,370 @@
+import datetime
+import tempfile
+import unittest
+from pathlib import Path
+
+from todo.manager import Manager
+from todo.rule import TodoRule
+from todo.storage import JOURNAL_LIMIT
+
+
+class TestJournal(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmp.name) / "data.yaml"
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_should_replay_journal_on_load(self):
+        manager = Manager(self.path)
+        first = manager.append(TodoRule("first", "", "2023-05-30", ""))
+        second = manager.append(TodoRule("second", "group", "", "comment"))
+        manager.mark(first, "completed")
+        manager.update(second, TodoRule("renamed", "group", "", "comment"))
+        manager.save()
+
+        self.assertFalse(self.path.exists())
+        loaded = Manager(self.path)
+        self.assertEqual(loaded.info(first).status, "completed")
+        self.assertEqual(loaded.info(second).title, "renamed")
+
+        loaded.remove(first)
+        loaded.save()
+        with self.assertRaises(KeyError):
+            Manager(self.path).info(first)
+
+    def test_should_fold_journal_into_snapshot(self):
+        manager = Manager(self.path)
+        for i in range(JOURNAL_LIMIT):
+            manager.append(TodoRule(f"task {i}", "", "", ""))
+        manager.save()
+
+        self.assertTrue(self.path.exists())
+        self.assertFalse(manager.store.journal_path.exists())
+        loaded = Manager(self.path)
+        self.assertEqual(len(loaded.data), JOURNAL_LIMIT)
+        self.assertEqual(loaded.next_id, JOURNAL_LIMIT + 1)
+
+    def test_should_tolerate_journal_already_in_snapshot(self):
+        manager = Manager(self.path)
+        id = manager.append(TodoRule("task", "", "", ""))
+        manager.mark(id, "completed")
+        manager.save()
+        ops = manager.store.load_journal()
+        manager.compact()
+        manager.store.append(ops)
+
+        loaded = Manager(self.path)
+        self.assertEqual(len(loaded.data), 1)
+        self.assertEqual(loaded.info(id).status, "completed")
+
+    def test_should_validate_snapshot(self):
+        self.path.write_text(
+            "- {id: 1, title: a, group: '', due_date: '', comment: ''}"
+        )
+        self.assertEqual(Manager(self.path).info(1).status, "uncompleted")
+
+        for text in [
+            "- {id: 1, title: a, group: '', due_date: '', comment: '', x: 1}",
+            "- {id: '1', title: a, group: '', due_date: '', comment: ''}",
+            "- {id: 1, title: a, group: '', comment: ''}",
+            "- !!python/object:object {}",
+            "{}",
+        ]:
+            self.path.write_text(text)
+            with self.assertRaises(ValueError):
+                Manager(self.path)
+
+    def test_should_ignore_torn_record(self):
+        manager = Manager(self.path)
+        manager.append(TodoRule("task", "", "", ""))
+        manager.save()
+        with manager.store.journal_path.open("a") as f:
+            f.write('{"op": "rem')
+
+        self.assertEqual(len(Manager(self.path).data), 1)
+
+    def test_should_follow_ids_taken_by_other_process(self):
+        manager = Manager(self.path)
+        manager.append(TodoRule("mine", "", "", ""))
+        manager.mark(1, "completed")
+        manager.update(1, TodoRule("mine, renamed", "", "", "", status="completed"))
+        other = Manager(self.path)
+        other.append(TodoRule("theirs", "", "", ""))
+        other.save()
+        manager.save()
+
+        loaded = Manager(self.path)
+        self.assertEqual(loaded.info(1).title, "theirs")
+        self.assertEqual(loaded.info(1).status, "uncompleted")
+        self.assertEqual(loaded.info(2).title, "mine, renamed")
+        self.assertEqual(loaded.info(2).status, "completed")
+
+    def test_should_keep_records_saved_after_torn_one(self):
+        manager = Manager(self.path)
+        manager.append(TodoRule("task", "", "", ""))
+        manager.save()
+        with manager.store.journal_path.open("a") as f:
+            f.write('{"op": "app')
+
+        for title in ["second", "third"]:
+            manager = Manager(self.path)
+            manager.append(TodoRule(title, "", "", ""))
+            manager.save()
+        titles = [rule.title for rule in Manager(self.path).iter_rules()]
+        self.assertEqual(titles, ["task", "second", "third"])
+
+
+class TestUnitOfWork(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmp.name) / "data.yaml"
+        self.journal_path = self.path.with_suffix(".journal")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_should_write_once_on_exit(self):
+        with Manager(self.path) as manager:
+            for i in range(3):
+                manager.append(TodoRule(f"task {i}", "", "", ""))
+            manager.mark(1, "completed")
+            self.assertTrue(manager.dirty)
+            self.assertFalse(self.journal_path.exists())
+
+        self.assertFalse(manager.dirty)
+        self.assertEqual(len(self.journal_path.read_text().splitlines()), 4)
+        self.assertEqual(Manager(self.path).info(1).status, "completed")
+
+    def test_should_not_write_unchanged_todos(self):
+        with Manager(self.path) as manager:
+            manager.append(
+                TodoRule("task", "group", "2023-05-30", "", status="completed")
+            )
+        mtime = self.journal_path.stat().st_mtime_ns
+
+        with Manager(self.path) as manager:
+            manager.update(
+                1, TodoRule("task", "group", "2023-05-30", "", status="completed")
+            )
+            manager.mark(1, "completed")
+            self.assertFalse(manager.dirty)
+        self.assertEqual(self.journal_path.stat().st_mtime_ns, mtime)
+
+    def test_should_not_write_on_error(self):
+        with self.assertRaises(KeyError):
+            with Manager(self.path) as manager:
+                manager.append(TodoRule("task", "", "", ""))
+                manager.mark(2, "completed")
+        self.assertFalse(manager.dirty)
+        self.assertFalse(self.journal_path.exists())
+        with self.assertRaises(KeyError):
+            manager.info(1)
+
+
+class TestRecurrence(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmp.name) / "data.yaml"
+        self.manager = Manager(self.path)
+        self.manager.append(TodoRule("single", "", "2023-05-03", ""))
+        self.manager.append(TodoRule("daily", "", "2023-05-01 daily", ""))
+        self.manager.append(TodoRule("weekly", "", "2023-05-03 weekly", ""))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def ids(self, rules):
+        return [(rule.due_date.day, rule.id) for rule in rules]
+
+    def test_should_expand_occurrences_of_window(self):
+        result = self.manager.instances("2023-05-03", "uncompleted")
+        self.assertEqual(self.ids(result), [(3, 1), (3, 2), (3, 3)])
+        result = self.manager.iter_range(
+            "uncompleted", datetime.date(2023, 5, 9), datetime.date(2023, 5, 10)
+        )
+        self.assertEqual(self.ids(result), [(9, 2), (10, 2), (10, 3)])
+
+    def test_should_store_occurrence_status_sparsely(self):
+        self.manager.mark(2, "completed", datetime.date(2023, 5, 3))
+        self.manager.mark(3, "not-planed", datetime.date(2023, 5, 10))
+        with self.assertRaises(ValueError):
+            self.manager.mark(3, "completed", datetime.date(2023, 5, 11))
+        self.manager.save()
+
+        loaded = Manager(self.path)
+        result = loaded.instances("2023-05-03", "uncompleted")
+        self.assertEqual(self.ids(result), [(3, 1), (3, 3)])
+        result = loaded.instances("2023-05-03", "completed")
+        self.assertEqual(self.ids(result), [(3, 2)])
+        # without walking the whole unbounded series
+        result = loaded.iter_range("not-planed", datetime.date(2023, 5, 1), None)
+        self.assertEqual(self.ids(result), [(10, 3)])
+        self.assertEqual(
+            loaded.info(2).into_dict()["overrides"], {"2023-05-03": "completed"}
+        )
+
+        loaded.compact()
+        rule = Manager(self.path).info(3)
+        self.assertEqual(rule.status_on(datetime.date(2023, 5, 10)), "not-planed")
+
+    def test_should_keep_overrides_on_update(self):
+        self.manager.mark(3, "completed", datetime.date(2023, 5, 10))
+        self.manager.mark(3, "completed", datetime.date(2023, 5, 17))
+        self.manager.update(3, TodoRule("renamed", "", "2023-05-03 weekly", ""))
+        rule = self.manager.info(3)
+        self.assertEqual(len(rule.overrides), 2)
+
+        self.manager.update(3, TodoRule("renamed", "", "2023-05-10 every 2 weeks", ""))
+        rule = self.manager.info(3)
+        self.assertEqual(list(rule.overrides), [datetime.date(2023, 5, 10)])
+
+
+class TestConcurrentWriters(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmp.name) / "data.yaml"
+        manager = Manager(self.path)
+        manager.append(TodoRule("shared", "", "", ""))
+        manager.compact()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_should_keep_both_writers_changes(self):
+        first = Manager(self.path)
+        second = Manager(self.path)
+        first.append(TodoRule("from first", "", "", ""))
+        first.save()
+        second.append(TodoRule("from second", "", "", ""))
+        second.mark(1, "completed")
+        second.save()
+
+        loaded = Manager(self.path)
+        self.assertEqual(
+            [rule.title for rule in loaded.iter_rules()],
+            ["shared", "from first", "from second"],
+        )
+        self.assertEqual(loaded.info(1).status, "completed")
+
+    def test_should_drop_changes_to_removed_todos(self):
+        first = Manager(self.path)
+        second = Manager(self.path)
+        first.remove(1)
+        first.compact()
+        second.mark(1, "completed")
+        second.save()
+
+        with self.assertRaises(KeyError):
+            Manager(self.path).info(1)
+
+    def test_should_not_leave_temporary_files(self):
+        manager = Manager(self.path)
+        manager.append(TodoRule("more", "", "", ""))
+        manager.compact()
+        self.assertEqual(
+            sorted(path.name for path in self.path.parent.iterdir()),
+            ["data.bin", "data.groups", "data.lock", "data.yaml"],
+        )
+
+
+class TestLazyLoading(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmp.name) / "data.yaml"
+
+        manager = Manager(self.path)
+        for i in range(10):
+            manager.append(TodoRule(f"task {i}", "", f"2023-05-{i + 1}", ""))
+        manager.compact()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_should_load_only_requested_records(self):
+        manager = Manager(self.path, lazy=True)
+        self.assertEqual(manager.data, {})
+        self.assertEqual(manager.next_id, 11)
+
+        self.assertEqual(manager.info(3).title, "task 2")
+        manager.mark(5, "completed")
+        manager.remove(7)
+        self.assertEqual(list(manager.data), [3, 5])
+        manager.save()
+
+        ids = [rule.id for rule in Manager(self.path).instances(None, "uncompleted")]
+        self.assertEqual(ids, [1, 2, 3, 4, 6, 8, 9, 10])
+
+    def test_should_load_everything_for_listing(self):
+        manager = Manager(self.path, lazy=True)
+        manager.info(4)
+        manager.append(TodoRule("new", "", "", ""))
+
+        ids = [rule.id for rule in manager.instances(None, "uncompleted")]
+        self.assertEqual(ids, [11] + list(range(1, 11)))
+
+    def test_should_fall_back_if_binary_snapshot_is_stale(self):
+        with self.path.open("a") as f:
+            f.write(
+                "- {id: 11, title: edited by hand, group: '', due_date: '',"
+                " comment: '', status: uncompleted}\n"
+            )
+
+        manager = Manager(self.path, lazy=True)
+        self.assertEqual(len(manager.data), 11)
+        self.assertEqual(manager.info(11).title, "edited by hand")
+
+
+class TestInstances(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.manager = Manager(Path(self.tmp.name) / "data.yaml")
+        for i, due_date in enumerate(["", "5-30", "5-1", "", "5-30", "5-2", "5-1"]):
+            self.manager.append(TodoRule(f"task {i}", "", due_date, ""))
+        self.manager.mark(6, "completed")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_should_sort_by_due_date(self):
+        ids = [rule.id for rule in self.manager.instances(None, "uncompleted")]
+        self.assertEqual(ids, [1, 4, 3, 7, 2, 5])
+        ids = [rule.id for rule in self.manager.instances(None, "completed")]
+        self.assertEqual(ids, [6])
+
+    def test_should_keep_sort_index_up_to_date(self):
+        self.manager.instances(None, "uncompleted")
+        self.manager.mark(3, "completed")
+        self.manager.update(2, TodoRule("moved", "", "5-2", ""))
+        self.manager.remove(4)
+        self.manager.append(TodoRule("new", "", "5-1", ""))
+        self.manager.mark(6, "uncompleted")
+
+        rebuilt = Manager(self.manager.store.path)
+        rebuilt.journal = self.manager.journal
+        rebuilt.save()
+        rebuilt = Manager(self.manager.store.path)
+        for status in ["uncompleted", "completed"]:
+            ids = [rule.id for rule in self.manager.instances(None, status)]
+            expected = [rule.id for rule in rebuilt.instances(None, status)]
+            self.assertEqual(ids, expected)
+        self.assertEqual(
+            [rule.id for rule in self.manager.instances(None, "uncompleted")],
+            [1, 7, 8, 2, 6, 5],
+        )
+
+    def test_should_query_date_range(self):
+        year = self.manager.info(2).due_date.year
+        start = datetime.date(year, 5, 2)
+        end = datetime.date(year, 5, 30)
+        ids = [rule.id for rule in self.manager.iter_range("uncompleted", start, end)]
+        self.assertEqual(ids, [2, 5])
+
+    def test_should_page_like_slicing(self):
+        for status in ["uncompleted", "completed"]:
+            expected = self.manager.instances(None, status)
+            for offset in range(8):
+                for limit in range(8):
+                    result = self.manager.iter_instances(None, status, limit, offset)
+                    self.assertEqual(list(result), expected[offset : offset + limit])
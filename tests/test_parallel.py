@@ -0,0 +1,116 @@
+import datetime
+import json
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+import yaml
+
+from todo import parallel
+from todo.manager import Manager
+from todo.parallel import load_files
+from todo.rule import TodoRule
+from todo.storage import Store
+
+
+class TestLoadFiles(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp.name)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_should_parse_chunks_like_the_whole_files(self):
+        paths = []
+        for n in range(3):
+            store = Store(self.dir / f"data{n}.yaml")
+            store.compact(
+                [
+                    TodoRule(f"task {i}", "group", "2023-05-30 every 1 week", "a\n- b")
+                    if i % 7 == 0
+                    else TodoRule(f"task {i}", "", "", "")
+                    for i in range(1 + n * 100, 101 + n * 100)
+                ]
+            )
+            paths.append(store.path)
+        paths.append(self.dir / "missing.yaml")
+
+        expected = load_files(paths, Store.loader)
+        with mock.patch.object(parallel, "PARALLEL_MIN_BYTES", 0), mock.patch.object(
+            parallel, "CHUNK_BYTES", 1000
+        ):
+            self.assertGreater(
+                len(parallel.split(paths[0], paths[0].stat().st_size)), 1
+            )
+            result = load_files(paths, Store.loader, workers=2)
+
+        self.assertEqual(
+            [[rule.into_dict() for rule in rules] for rules in result],
+            [[rule.into_dict() for rule in rules] for rules in expected],
+        )
+        self.assertEqual(len(result[2]), 100)
+        self.assertEqual(result[3], [])
+
+    def test_should_report_invalid_chunks(self):
+        path = self.dir / "data.yaml"
+        path.write_text("- id: 1\n  title: 2\n")
+        with mock.patch.object(parallel, "PARALLEL_MIN_BYTES", 0):
+            with self.assertRaises(ValueError):
+                load_files([path], Store.loader, workers=2)
+
+    def write_items(self, path, ids):
+        # as edited by hand, with an alias to an anchor of the first item
+        lines = []
+        for i in ids:
+            group = "&group work" if not lines else "*group"
+            lines.append(f"- id: {i}\n  title: task {i}\n  group: {group}\n")
+            lines.append("  due_date: ''\n  comment: ''\n  status: uncompleted\n")
+        path.write_text("".join(lines))
+
+    def test_should_parse_whole_files_with_invalid_chunks(self):
+        path = self.dir / "data.yaml"
+        self.write_items(path, range(1, 101))
+        with mock.patch.object(parallel, "PARALLEL_MIN_BYTES", 0), mock.patch.object(
+            parallel, "CHUNK_BYTES", 1000
+        ):
+            [rules] = load_files([path], Store.loader, workers=2)
+        self.assertEqual(len(rules), 100)
+        self.assertEqual({rule.group for rule in rules}, {"work"})
+
+    def test_should_report_ids_found_twice(self):
+        path = self.dir / "data.yaml"
+        self.write_items(path, [*range(1, 51), 3])
+        with mock.patch.object(parallel, "PARALLEL_MIN_BYTES", 0), mock.patch.object(
+            parallel, "CHUNK_BYTES", 1000
+        ):
+            with self.assertLogs("todo.parallel", "WARNING"):
+                load_files([path], Store.loader, workers=2)
+
+
+class TestShardConflicts(unittest.TestCase):
+    def test_should_keep_the_copy_in_the_manifest(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "data.yaml"
+            manager = Manager(path)
+            manager.append(TodoRule("moved", "", "2023-04-01", ""))
+            manager.mark(1, "completed")
+            manager.archive(datetime.date(2023, 5, 1))
+            # a copy the manifest doesn't know about, as left by a crash
+            archive = manager.store.archive
+            stale = TodoRule("stale", "", "", "", 1, "completed")
+            archive.shard_path("undated").write_text(
+                yaml.dump([stale.into_dict()], Dumper=archive.dumper)
+            )
+            manifest = json.loads(archive.manifest_path.read_text())
+            manifest["shards"]["undated"] = []
+            archive.manifest_path.write_text(json.dumps(manifest))
+
+            loaded = Manager(path)
+            with self.assertLogs("todo.manager", "WARNING"):
+                rules = list(loaded.iter_rules())
+            self.assertEqual([rule.title for rule in rules], ["moved"])
+
+
+if __name__ == "__main__":
+    unittest.main()
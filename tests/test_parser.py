@@ -216,3 +216,21 @@ class TestEditorParser(unittest.TestCase):
             Sample ToDo
             Comment without inserting a new line.
             """)
+
+
+class TestIdParser(unittest.TestCase):
+    def test_should_accept_ids_and_ranges(self):
+        result = parse_ids(["3", "7-9", "1"])
+        self.assertEqual(result, [3, 7, 8, 9, 1])
+
+    def test_should_drop_duplicates(self):
+        result = parse_ids(["2-4", "3", "4-5"])
+        self.assertEqual(result, [2, 3, 4, 5])
+
+    def test_should_raise_value_error_for_invalid_id(self):
+        with self.assertRaises(ValueError):
+            parse_ids(["abc"])
+        with self.assertRaises(ValueError):
+            parse_ids(["5-3"])
+        with self.assertRaises(ValueError):
+            parse_ids(["-3"])
@@ -0,0 +1,107 @@
+import datetime
+import tempfile
+import unittest
+from pathlib import Path
+
+from todo.manager import Manager
+from todo.query import compile_query
+from todo.rule import TodoRule
+from todo.sqlite import SqliteManager
+from todo.utils import freeze_today
+
+
+class TestCompileQuery(unittest.TestCase):
+    def setUp(self):
+        freeze_today(datetime.date(2023, 5, 30))
+
+    def tearDown(self):
+        freeze_today(None)
+
+    def test_should_resolve_date_bounds(self):
+        query = compile_query("due:2024-01..2024-02")
+        self.assertEqual(query.start, datetime.date(2024, 1, 1))
+        self.assertEqual(query.end, datetime.date(2024, 2, 29))
+
+        query = compile_query("due:<2w due:>=06-01")
+        self.assertEqual(query.start, datetime.date(2023, 6, 1))
+        self.assertEqual(query.end, datetime.date(2023, 6, 12))
+
+        query = compile_query("is:overdue")
+        self.assertEqual(query.start, None)
+        self.assertEqual(query.end, datetime.date(2023, 5, 29))
+
+    def test_should_read_statuses_and_groups(self):
+        query = compile_query("status:completed,not-planed group:work*")
+        self.assertEqual(query.statuses, ["completed", "not-planed"])
+        self.assertEqual(query.groups, ["work*"])
+        self.assertEqual(compile_query("report", "completed").statuses, ["completed"])
+
+    def test_should_reject_unknown_terms(self):
+        for expr in ["status:done", "color:red", "due:2024-13"]:
+            with self.subTest(expr=expr), self.assertRaises(ValueError):
+                compile_query(expr)
+
+
+class TestIterQuery(unittest.TestCase):
+    def setUp(self):
+        freeze_today(datetime.date(2023, 5, 30))
+        self.tmp = tempfile.TemporaryDirectory()
+        self.manager = Manager(Path(self.tmp.name) / "data.yaml")
+        self.sqlite = SqliteManager(Path(self.tmp.name) / "data.sqlite3")
+        rules = [
+            TodoRule("Write report", "work", "2023-05-20", ""),
+            TodoRule("Review report", "work/team", "2023-06-02", "before lunch"),
+            TodoRule("Buy milk", "home", "", ""),
+            TodoRule("Call bank", "home", "2023-06-10", "about the report"),
+            TodoRule("Stand-up", "work", "2023-05-29 every 1 day until 06-05", ""),
+            TodoRule("Old task", "work", "2023-01-15", ""),
+        ]
+        for manager in (self.manager, self.sqlite):
+            manager.extend(TodoRule.from_record(rule.into_dict()) for rule in rules)
+            manager.mark(6, "completed")
+            manager.mark(5, "completed", datetime.date(2023, 5, 30))
+
+    def tearDown(self):
+        freeze_today(None)
+        self.sqlite.conn.close()
+        self.tmp.cleanup()
+
+    def query(self, expr: str, status: str = "uncompleted") -> list:
+        ids = [
+            [(rule.id, rule.due_date) for rule in manager.iter_query(expr, status)]
+            for manager in (self.manager, self.sqlite)
+        ]
+        self.assertEqual(ids[0], ids[1])
+        return [id for id, _ in ids[0]]
+
+    def test_should_filter_by_due_date(self):
+        self.assertEqual(self.query("due:none"), [3])
+        self.assertEqual(self.query("is:overdue"), [1, 5])
+        self.assertEqual(self.query("due:05-31..06-02"), [5, 5, 2, 5])
+        self.assertEqual(self.query("due:2023-05", "completed"), [5])
+
+    def test_should_list_series_once_without_end(self):
+        for manager in (self.manager, self.sqlite):
+            manager.append(TodoRule("Water plants", "home", "2023-05-29 daily", ""))
+        self.assertEqual(self.query("due:>2023-06-01"), [2, 5, 7, 4])
+        self.assertEqual(self.query("due:>=today"), [7, 5, 2, 4])
+
+    def test_should_filter_by_group(self):
+        self.assertEqual(self.query("group:home"), [3, 4])
+        self.assertEqual(self.query("group:work*"), [1, 5, 2])
+        self.assertEqual(self.query("group:work -due:<06-01"), [])
+
+    def test_should_filter_by_status_and_text(self):
+        self.assertEqual(self.query("report"), [1, 2, 4])
+        self.assertEqual(self.query("status:completed,uncompleted task"), [6])
+        self.assertEqual(
+            self.query("status:uncompleted,completed report due:any -bank"), [1, 2]
+        )
+
+    def test_should_page_results(self):
+        result = self.manager.iter_query("group:work*", "uncompleted", 2, 1)
+        self.assertEqual([rule.id for rule in result], [5, 2])
+
+
+if __name__ == "__main__":
+    unittest.main()
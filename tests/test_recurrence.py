@@ -0,0 +1,51 @@
+import datetime
+import unittest
+
+from todo.parser import parse_due
+from todo.recurrence import Recurrence
+
+
+class TestRecurrence(unittest.TestCase):
+    def test_should_repeat_every_n_days_and_weeks(self):
+        start = datetime.date(2023, 5, 1)
+        result = Recurrence(3, "day").occurrences(start, datetime.date(2023, 5, 5))
+        self.assertEqual(
+            [next(result), next(result)],
+            [datetime.date(2023, 5, 7), datetime.date(2023, 5, 10)],
+        )
+        result = Recurrence(2, "week").occurrences(
+            start, datetime.date(2023, 5, 2), datetime.date(2023, 6, 1)
+        )
+        self.assertEqual(
+            list(result), [datetime.date(2023, 5, 15), datetime.date(2023, 5, 29)]
+        )
+
+    def test_should_keep_day_of_month(self):
+        start = datetime.date(2023, 1, 31)
+        result = Recurrence(1, "month").occurrences(
+            start, last=datetime.date(2023, 4, 30)
+        )
+        self.assertEqual(
+            [day.isoformat() for day in result],
+            ["2023-01-31", "2023-02-28", "2023-03-31", "2023-04-30"],
+        )
+        yearly = Recurrence(1, "year")
+        self.assertTrue(yearly.includes(start, datetime.date(2033, 1, 31)))
+        self.assertFalse(yearly.includes(start, datetime.date(2033, 1, 30)))
+
+    def test_should_stop_at_until(self):
+        start = datetime.date(2023, 5, 1)
+        daily = Recurrence(1, "day", datetime.date(2023, 5, 3))
+        self.assertEqual(len(list(daily.occurrences(start))), 3)
+        self.assertFalse(daily.includes(start, datetime.date(2023, 5, 4)))
+        self.assertFalse(daily.includes(start, datetime.date(2023, 4, 30)))
+
+
+class TestDueParser(unittest.TestCase):
+    def test_should_split_recurrence(self):
+        self.assertEqual(parse_due("2023-05-30"), ("2023-05-30", None))
+        date, recurrence = parse_due("2023-05-01 every 2 weeks until 2023-12-31")
+        self.assertEqual(date, "2023-05-01")
+        self.assertEqual(recurrence, Recurrence(2, "week", datetime.date(2023, 12, 31)))
+        self.assertEqual(parse_due("daily"), ("", Recurrence(1, "day")))
+        self.assertEqual(parse_due("monday Every Month")[1], Recurrence(1, "month"))
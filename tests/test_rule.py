@@ -0,0 +1,53 @@
+import datetime
+import unittest
+
+from todo.parser import parse_editor
+from todo.rule import TodoRule
+from todo.utils import freeze_today
+
+
+class TestFromRecord(unittest.TestCase):
+    def record(self, due_date):
+        return {
+            "id": 1,
+            "title": "title",
+            "group": "group",
+            "due_date": due_date,
+            "comment": "",
+            "status": "completed",
+        }
+
+    def test_should_decode_iso_date(self):
+        rule = TodoRule.from_record(self.record("2023-05-30"))
+        self.assertEqual(rule.due_date, datetime.date(2023, 5, 30))
+        self.assertEqual(rule.status, "completed")
+        self.assertEqual(rule.into_dict(), self.record("2023-05-30"))
+
+    def test_should_accept_missing_date(self):
+        rule = TodoRule.from_record(self.record(""))
+        self.assertIsNone(rule.due_date)
+
+    def test_should_accept_date_edited_by_hand(self):
+        rule = TodoRule.from_record(self.record("2023/5/30"))
+        self.assertEqual(rule.due_date, datetime.date(2023, 5, 30))
+        rule = TodoRule.from_record(self.record(datetime.date(2023, 5, 30)))
+        self.assertEqual(rule.due_date, datetime.date(2023, 5, 30))
+
+
+class TestFmtEditor(unittest.TestCase):
+    def test_should_read_back_past_series(self):
+        rule = TodoRule("stand-up", "work", "2024-01-01 every 1 day", "")
+        rule.set_override(datetime.date(2024, 3, 1), "completed")
+        edited = TodoRule(*parse_editor(rule.fmt_editor()))
+        edited.inherit_overrides(rule)
+        self.assertEqual(edited.due_date, datetime.date(2024, 1, 1))
+        self.assertEqual(edited.into_dict(), rule.into_dict())
+
+    def test_should_read_back_past_dates(self):
+        freeze_today(datetime.date(2026, 10, 18))
+        self.addCleanup(freeze_today, None)
+        for day in ["2026-10-10", "2026-10-17", "2026-10-18", "2026-10-22"]:
+            rule = TodoRule("task", "", day, "")
+            with self.subTest(day=day):
+                edited = TodoRule(*parse_editor(rule.fmt_editor()))
+                self.assertEqual(edited.into_dict(), rule.into_dict())
@@ -0,0 +1,101 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from todo.manager import Manager
+from todo.rule import TodoRule
+from todo.search import SearchIndex
+from todo.sqlite import SqliteManager
+
+
+class TestSearchIndex(unittest.TestCase):
+    def rule(self, id, title, group="", comment=""):
+        return TodoRule(title, group, "", comment, id=id)
+
+    def test_should_rank_titles_and_several_terms_first(self):
+        index = SearchIndex()
+        index.add(self.rule(1, "Buy milk", comment="and bread"))
+        index.add(self.rule(2, "Call the bank", comment="about the milk bill"))
+        index.add(self.rule(3, "Bread", group="shopping"))
+        index.add(self.rule(4, "Walk the dog"))
+
+        self.assertEqual([id for id, _ in index.search("milk")], [1, 2])
+        self.assertEqual([id for id, _ in index.search("MILK bread")][:1], [1])
+        self.assertEqual([id for id, _ in index.search("shopping")], [3])
+        self.assertEqual(index.search("cheese"), [])
+
+        index.discard(1)
+        index.add(self.rule(4, "Walk the dog, buy milk"))
+        self.assertEqual([id for id, _ in index.search("milk", 1)], [4])
+
+
+class TestManagerSearch(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp.name)
+        self.path = self.dir / "data.yaml"
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def fill(self, manager):
+        manager.append(TodoRule("Buy milk", "errands", "", ""))
+        manager.append(TodoRule("Write report", "work", "", "numbers from the bank"))
+        manager.append(TodoRule("Call the bank", "errands", "", ""))
+
+    def titles(self, rules):
+        return [rule.title for rule in rules]
+
+    def test_should_catch_up_with_journal(self):
+        with Manager(self.path) as manager:
+            self.fill(manager)
+            manager.compact()
+            self.assertEqual(
+                self.titles(manager.search("bank")), ["Call the bank", "Write report"]
+            )
+        index_path = self.path.with_suffix(".index")
+        mtime = index_path.stat().st_mtime_ns
+
+        with Manager(self.path, lazy=True) as manager:
+            manager.remove(3)
+            manager.update(1, TodoRule("Ask the bank", "errands", "", ""))
+            manager.append(TodoRule("Bank holiday", "", "", ""))
+
+        manager = Manager(self.path, lazy=True)
+        self.assertEqual(
+            self.titles(manager.search("bank")),
+            ["Bank holiday", "Ask the bank", "Write report"],
+        )
+        self.assertEqual(manager.search("milk"), [])
+        self.assertEqual(index_path.stat().st_mtime_ns, mtime)
+
+    def test_should_persist_saved_todos_only(self):
+        with Manager(self.path) as manager:
+            self.fill(manager)
+            manager.compact()
+        manager = Manager(self.path)
+        manager.append(TodoRule("Bank holiday", "", "", ""))
+        manager.remove(3)
+        self.assertEqual(
+            self.titles(manager.search("bank")), ["Bank holiday", "Write report"]
+        )
+        manager.discard()
+
+        manager = Manager(self.path, lazy=True)
+        self.assertEqual(
+            self.titles(manager.search("bank")), ["Call the bank", "Write report"]
+        )
+
+    def test_should_search_sqlite_like_yaml(self):
+        yaml_manager = Manager(self.path)
+        sqlite_manager = SqliteManager(self.dir / "data.sqlite3")
+        for manager in [yaml_manager, sqlite_manager]:
+            self.fill(manager)
+            manager.update(1, TodoRule("Buy milk at the bank", "errands", "", ""))
+            manager.remove(2)
+
+        for query in ["bank", "errands milk", "report"]:
+            self.assertEqual(
+                self.titles(sqlite_manager.search(query)),
+                self.titles(yaml_manager.search(query)),
+            )
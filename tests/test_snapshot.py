@@ -0,0 +1,74 @@
+import datetime
+import os
+import tempfile
+import unittest
+from pathlib import Path
+
+from todo.rule import TodoRule
+from todo.snapshot import read_snapshot, write_snapshot
+from todo.utils import atomic_write
+
+
+class TestSnapshot(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.source = Path(self.tmp.name) / "data.yaml"
+        self.source.write_text("[]")
+        self.path = Path(self.tmp.name) / "data.bin"
+
+        self.rules = [
+            TodoRule("ünïcode", "group", "2023-05-30", "two\nlines", 3, "completed"),
+            TodoRule("no date", "", "", "", 1, "not-planed"),
+        ]
+        write_snapshot(self.path, self.source, self.rules)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_should_read_all_records_by_id(self):
+        snapshot = read_snapshot(self.path, self.source)
+        self.assertEqual(len(snapshot), 2)
+        self.assertEqual(
+            list(snapshot),
+            [
+                (1, "no date", "", None, "", "not-planed", None, None),
+                (
+                    3,
+                    "ünïcode",
+                    "group",
+                    datetime.date(2023, 5, 30),
+                    "two\nlines",
+                    "completed",
+                    None,
+                    None,
+                ),
+            ],
+        )
+        self.assertEqual(snapshot.max_id(), 3)
+
+    def test_should_look_up_mapped_records(self):
+        snapshot = read_snapshot(self.path, self.source, mapped=True)
+        self.assertEqual(snapshot.get(3)[1], "ünïcode")
+        self.assertIsNone(snapshot.get(2))
+        self.assertIsNone(snapshot.get(4))
+        snapshot.close()
+
+    def test_should_keep_recurrence(self):
+        rule = TodoRule("weekly", "", "2023-05-01 every 2 weeks until 2023-12-31", "")
+        rule.id = 5
+        rule.set_override(datetime.date(2023, 5, 15), "completed")
+        write_snapshot(self.path, self.source, [rule])
+
+        fields = read_snapshot(self.path, self.source).get(5)
+        self.assertEqual(TodoRule.from_fields(*fields).into_dict(), rule.into_dict())
+
+    def test_should_ignore_stale_snapshot(self):
+        self.source.write_text("[] ")
+        self.assertIsNone(read_snapshot(self.path, self.source))
+
+    def test_should_ignore_snapshot_of_replaced_source(self):
+        # same size and mtime, as within a tick of a coarse clock
+        stat = self.source.stat()
+        atomic_write(self.source, b"{}")
+        os.utime(self.source, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        self.assertIsNone(read_snapshot(self.path, self.source))
@@ -0,0 +1,103 @@
+import datetime
+import tempfile
+import unittest
+from pathlib import Path
+
+from todo.manager import Manager
+from todo.rule import TodoRule
+from todo.sqlite import SqliteManager
+
+
+class TestSqliteManager(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp.name)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def fill(self, manager):
+        manager.append(TodoRule("a", "", "2023-05-30", ""))
+        manager.append(TodoRule("b", "", "", ""))
+        manager.append(TodoRule("c", "", "2023-05-01", ""))
+        manager.append(TodoRule("d", "", "2023-05-30", ""))
+        manager.append(TodoRule("e", "", "", ""))
+        manager.append(TodoRule("f", "", "2023-05-02 every 4 weeks", ""))
+        for id in [1, 2, 4]:
+            manager.mark(id, "completed")
+        manager.mark(6, "not-planed", datetime.date(2023, 5, 2))
+
+    def test_should_order_like_yaml_manager(self):
+        yaml_manager = Manager(self.dir / "data.yaml")
+        sqlite_manager = SqliteManager(self.dir / "data.sqlite3")
+        self.fill(yaml_manager)
+        self.fill(sqlite_manager)
+
+        for status in ["completed", "uncompleted", "not-planed"]:
+            for date in [None, "2023-05-02", "2023-05-30"]:
+                expected = [r.id for r in yaml_manager.instances(date, status)]
+                result = [r.id for r in sqlite_manager.instances(date, status)]
+                self.assertEqual(result, expected)
+
+    def test_should_page_like_slicing(self):
+        manager = SqliteManager(self.dir / "data.sqlite3")
+        self.fill(manager)
+        expected = [rule.id for rule in manager.instances(None, "completed")]
+        for offset in range(4):
+            for limit in range(4):
+                result = manager.iter_instances(None, "completed", limit, offset)
+                self.assertEqual(
+                    [rule.id for rule in result], expected[offset : offset + limit]
+                )
+
+    def test_should_raise_key_error_for_unknown_id(self):
+        manager = SqliteManager(self.dir / "data.sqlite3")
+        with self.assertRaises(KeyError):
+            manager.info(1)
+        with self.assertRaises(KeyError):
+            manager.mark(1, "completed")
+        with self.assertRaises(KeyError):
+            manager.remove(1)
+
+    def test_should_not_write_unchanged_todos(self):
+        manager = SqliteManager(self.dir / "data.sqlite3")
+        manager.append(TodoRule("task", "group", "2023-05-30", ""))
+        manager.save()
+        manager.update(1, TodoRule("task", "group", "2023-05-30", ""))
+        self.assertFalse(manager.dirty)
+        manager.update(1, TodoRule("renamed", "group", "2023-05-30", ""))
+        self.assertTrue(manager.dirty)
+        manager.conn.close()
+
+    def test_should_roll_back_on_error(self):
+        with self.assertRaises(KeyError):
+            with SqliteManager(self.dir / "data.sqlite3") as manager:
+                manager.append(TodoRule("task", "", "", ""))
+                manager.mark(2, "completed")
+        manager.conn.close()
+        self.assertEqual(
+            list(SqliteManager(self.dir / "data.sqlite3").iter_rules()), []
+        )
+
+    def test_should_round_trip_yaml(self):
+        manager = SqliteManager(self.dir / "data.sqlite3")
+        self.fill(manager)
+        manager.save()
+        manager.export_yaml(self.dir / "export.yaml")
+
+        imported = SqliteManager(self.dir / "other.sqlite3")
+        imported.import_yaml(self.dir / "export.yaml")
+        self.assertEqual(imported.info(4).status, "completed")
+        self.assertEqual(imported.next_id, 7)
+        self.assertEqual(imported.info(6).into_dict(), manager.info(6).into_dict())
+
+    def test_should_import_archived_todos(self):
+        source = Manager(self.dir / "data.yaml")
+        source.append(TodoRule("old", "", "2023-04-01", ""))
+        source.append(TodoRule("new", "", "", ""))
+        source.mark(1, "completed")
+        source.archive(datetime.date(2023, 5, 1))
+
+        imported = SqliteManager(self.dir / "data.sqlite3")
+        imported.import_yaml(self.dir / "data.yaml")
+        self.assertEqual([rule.title for rule in imported.iter_rules()], ["old", "new"])
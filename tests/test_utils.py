@@ -1,7 +1,7 @@
 import datetime
 import unittest
 
-from todo.utils import date_to_relative
+from todo.utils import date_to_relative, freeze_today
 
 
 class TestDateToRelative(unittest.TestCase):
@@ -39,3 +39,24 @@ class TestDateToRelative(unittest.TestCase):
         after7days = datetime.date.today() + datetime.timedelta(days=7)
         result = date_to_relative(after7days)
         self.assertEqual(result, after7days.isoformat())
+
+
+class TestDailyCache(unittest.TestCase):
+    def tearDown(self):
+        freeze_today(None)
+
+    def test_should_count_hits_and_misses(self):
+        date_to_relative.cache_clear()
+        freeze_today(datetime.date(2023, 5, 30))
+        date_to_relative(datetime.date(2023, 5, 31))
+        date_to_relative(datetime.date(2023, 5, 31))
+        info = date_to_relative.cache_info()
+        self.assertEqual((info.hits, info.misses), (1, 1))
+
+    def test_should_invalidate_when_day_changes(self):
+        date = datetime.date(2023, 5, 31)
+        freeze_today(datetime.date(2023, 5, 30))
+        self.assertEqual(date_to_relative(date), "tomorrow")
+        freeze_today(datetime.date(2023, 5, 31))
+        self.assertEqual(date_to_relative(date), "today")
+        self.assertEqual(date_to_relative.cache_info().currsize, 1)
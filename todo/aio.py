@@ -0,0 +1,162 @@
+from __future__ import annotations
+import asyncio
+import datetime
+import functools
+import logging
+from pathlib import Path
+from typing import Callable, Iterable, TypeVar
+
+from .groups import Summary
+from .manager import Manager
+from .rule import TodoRule
+
+
+T = TypeVar("T")
+
+# Seconds without mutations before they are written, and at most since the
+# first one not written yet
+DEBOUNCE_DELAY = 0.1
+MAX_DELAY = 1.0
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncManager:
+    # Manager for asyncio programs. Every call runs in the default executor,
+    # one at a time, so file I/O never blocks the event loop. Mutations are
+    # written together by a single save once they stop coming, see
+    # DEBOUNCE_DELAY; call save() or close() to write them right away.
+    path: Path | None
+    manager: Manager | None
+    delay: float
+    max_delay: float
+    lock: asyncio.Lock
+    dirty_since: float | None  # loop time of the first unwritten mutation
+    timer: asyncio.TimerHandle | None
+    flushing: asyncio.Task | None
+
+    def __init__(
+        self,
+        path: Path | None = None,
+        delay: float = DEBOUNCE_DELAY,
+        max_delay: float = MAX_DELAY,
+    ) -> None:
+        self.path = path
+        self.manager = None
+        self.delay = delay
+        self.max_delay = max_delay
+        self.lock = asyncio.Lock()
+        self.dirty_since = None
+        self.timer = None
+        self.flushing = None
+
+    async def __aenter__(self) -> AsyncManager:
+        await self.load()
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+    async def load(self) -> None:
+        async with self.lock:
+            self.manager = await run(Manager, self.path)
+
+    async def instances(
+        self,
+        date: str | None,
+        status: str,
+        limit: int | None = None,
+        offset: int = 0,
+    ) -> list[TodoRule]:
+        manager = self._manager()
+        return await self._run(
+            lambda: list(manager.iter_instances(date, status, limit, offset))
+        )
+
+    async def query(
+        self,
+        expr: str,
+        status: str,
+        limit: int | None = None,
+        offset: int = 0,
+    ) -> list[TodoRule]:
+        manager = self._manager()
+        return await self._run(
+            lambda: list(manager.iter_query(expr, status, limit, offset))
+        )
+
+    async def search(self, query: str, limit: int | None = None) -> list[TodoRule]:
+        return await self._run(self._manager().search, query, limit)
+
+    async def groups(self) -> list[Summary]:
+        return await self._run(self._manager().groups)
+
+    async def info(self, id: int) -> TodoRule:
+        return await self._run(self._manager().info, id)
+
+    async def append(self, rule: TodoRule) -> int:
+        return await self._mutate(self._manager().append, rule)
+
+    async def extend(self, rules: Iterable[TodoRule]) -> list[int]:
+        return await self._mutate(self._manager().extend, list(rules))
+
+    async def update(self, id: int, rule: TodoRule):
+        await self._mutate(self._manager().update, id, rule)
+
+    async def mark(self, id: int, status: str, date: datetime.date | None = None):
+        await self._mutate(self._manager().mark, id, status, date)
+
+    async def remove(self, id: int):
+        await self._mutate(self._manager().remove, id)
+
+    async def save(self) -> None:
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        self.dirty_since = None
+        await self._run(self._manager().save)
+
+    async def close(self) -> None:
+        await self.save()
+        if self.flushing is not None:
+            await self.flushing
+
+    async def _run(self, fn: Callable[..., T], *args) -> T:
+        async with self.lock:
+            return await run(fn, *args)
+
+    async def _mutate(self, fn: Callable[..., T], *args) -> T:
+        result = await self._run(fn, *args)
+        self._schedule()
+        return result
+
+    def _schedule(self):
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        if self.dirty_since is None:
+            self.dirty_since = now
+        if self.timer is not None:
+            self.timer.cancel()
+        when = min(now + self.delay, self.dirty_since + self.max_delay)
+        self.timer = loop.call_at(when, self._flush)
+
+    def _flush(self):
+        self.timer = None
+        self.flushing = asyncio.create_task(self._flush_in_background())
+
+    async def _flush_in_background(self):
+        try:
+            await self.save()
+        except Exception:
+            # the mutations stay pending and go with the next save
+            logger.exception("failed to save TODOs")
+
+    def _manager(self) -> Manager:
+        if self.manager is None:
+            raise RuntimeError("AsyncManager is not loaded yet")
+        return self.manager
+
+
+async def run(fn: Callable[..., T], *args) -> T:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, functools.partial(fn, *args))
@@ -0,0 +1,25 @@
+from __future__ import annotations
+import os
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from .manager import Manager
+    from .sqlite import SqliteManager
+
+
+BACKENDS = ["yaml", "sqlite"]
+
+
+def open_manager(
+    backend: str | None = None, lazy: bool = False
+) -> Manager | SqliteManager:
+    backend = backend or os.environ.get("TODO_BACKEND", "yaml")
+    if backend == "yaml":
+        from .manager import Manager
+
+        return Manager(lazy=lazy)
+    elif backend == "sqlite":
+        from .sqlite import SqliteManager
+
+        return SqliteManager()
+    raise ValueError(f"Unknown backend: {backend} (expected one of {BACKENDS})")
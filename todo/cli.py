@@ -1,7 +1,20 @@
+from __future__ import annotations
+import contextlib
+import datetime
+import logging
+from typing import TYPE_CHECKING, Callable, TextIO
 import click
 from .rule import TodoRule
-from .manager import Manager
-from .parser import parse_editor
+from .backend import open_manager
+from .daemon import connect, serve as serve_forever
+from .parser import parse_date, parse_editor, parse_ids
+from .groups import SEPARATOR
+from .exchange import FORMATS, guess_format, read_rules, write_rules
+from .utils import chunked, freeze_today
+
+if TYPE_CHECKING:
+    # not imported at runtime, so that clients of the daemon skip loading yaml
+    from .manager import Manager
 
 
 EDITOR_HELP = """
@@ -15,17 +28,48 @@ EDITOR_HELP = """
 // ...
 //
 // Lines which begin with double slashes ("//") is ignored. If you don't want to
-// set the GROUP or the DUE DATE field, delete the whole line.
+// set the GROUP or the DUE DATE field, delete the whole line. The DUE DATE may
+// be followed by a recurrence, like "monday every 2 weeks until 12-31".
 """
 
+IDS_HELP = "IDS are numbers or ranges such as 3-7; - reads them from stdin."
+
+# Number of lines written to the terminal at once by `list`
+LIST_CHUNK = 512
+
+# Commands touching a few TODOs, which don't need to load the whole data file
+POINT_COMMANDS = ["info", "edit", "mark", "remove", "search", "groups"]
+
 
 @click.group()
+@click.option(
+    "-v", "--verbose", is_flag=True, help="Log storage details such as lock waits."
+)
 @click.pass_context
-def main(ctx: click.Context):
-    ctx.ensure_object(Manager)
+def main(ctx: click.Context, verbose: bool):
+    if verbose:
+        logging.basicConfig(level=logging.DEBUG, format="%(name)s: %(message)s")
+    if ctx.invoked_subcommand != "serve":
+        # the daemon pins the date of each request instead
+        freeze_today(datetime.date.today())
+        if ctx.obj is None:
+            ctx.obj = connect()
+    if ctx.obj is None:
+        try:
+            ctx.obj = open_manager(lazy=ctx.invoked_subcommand in POINT_COMMANDS)
+        except ValueError as e:
+            ctx.fail(str(e))
+    # the changes of a command are written once it returns, if there are any
+    ctx.obj = ctx.with_resource(ctx.obj)
 
 
-@main.command(help="List up TODOs.")
+@main.command(
+    help="""List up TODOs matching every FILTER, such as due:<2w, due:2024-01..2024-03,
+    due:none, group:work, group:work*, status:completed,not-planed, is:overdue or a
+    word of the title or comment. Filters beginning with - exclude TODOs instead.
+    """
+)
+@click.argument("filters", nargs=-1)
 @click.option("--date", "-d", help="Pick up TODOs for the date.")
 @click.option(
     "-c",
@@ -49,12 +93,77 @@ def main(ctx: click.Context):
     flag_value="not-planed",
     help="Show TODOs marked as not-planed.",
 )
+@click.option(
+    "-n", "--limit", type=click.IntRange(min=0), help="Show at most this many TODOs."
+)
+@click.option(
+    "--offset", type=click.IntRange(min=0), default=0, help="Skip the first TODOs."
+)
 @click.pass_context
-def list(ctx: click.Context, date: str | None, status: str):
+def list(
+    ctx: click.Context,
+    filters: tuple[str, ...],
+    date: str | None,
+    status: str,
+    limit: int | None,
+    offset: int,
+):
     manager: Manager = ctx.obj
-    items = manager.instances(date, status)
-    for i in items:
-        click.echo(i.fmt_line())
+    if filters:
+        try:
+            if date:
+                # resolved first, as dates like "3 days" contain spaces
+                filters += (f"due:{parse_date(date).isoformat()}",)
+            items = manager.iter_query(" ".join(filters), status, limit, offset)
+        except ValueError as e:
+            ctx.fail(str(e))
+    else:
+        items = manager.iter_instances(date, status, limit, offset)
+    for chunk in chunked(items, LIST_CHUNK):
+        click.echo("\n".join(i.fmt_line() for i in chunk))
+
+
+@main.command(
+    help="Search TODOs by the WORDS of their title, group or comment, best"
+    " matches first."
+)
+@click.argument("words", nargs=-1, required=True)
+@click.option(
+    "-n", "--limit", type=click.IntRange(min=1), help="Show at most this many TODOs."
+)
+@click.pass_context
+def search(ctx: click.Context, words: tuple[str, ...], limit: int | None):
+    manager: Manager = ctx.obj
+    items = manager.search(" ".join(words), limit)
+    for chunk in chunked(items, LIST_CHUNK):
+        click.echo("\n".join(i.fmt_line() for i in chunk))
+
+
+@main.command(
+    help="Count TODOs by status in every group, groups below it included. Groups"
+    " are paths such as work/infra/db."
+)
+@click.pass_context
+def groups(ctx: click.Context):
+    manager: Manager = ctx.obj
+    click.echo(
+        "{:<30}{:>12}{:>12}{:>12}{:>12}".format(
+            "GROUP", "UNCOMPLETED", "OVERDUE", "COMPLETED", "NOT-PLANED"
+        )
+    )
+    for group, counts, overdue in manager.groups():
+        # indented under its parent
+        depth = group.count(SEPARATOR)
+        name = group.rsplit(SEPARATOR, 1)[-1] or "(no group)"
+        click.echo(
+            "{:<30}{:>12}{:>12}{:>12}{:>12}".format(
+                "  " * depth + name,
+                counts["uncompleted"],
+                overdue,
+                counts["completed"],
+                counts["not-planed"],
+            )
+        )
 
 
 @main.command(help="Show detailed information about a TODO.")
@@ -95,23 +204,67 @@ def new(ctx: click.Context, interactive: bool):
 
     manager: Manager = ctx.obj
     try:
-        id = manager.append(TodoRule(title, group, due_date, comment))
+        rule = TodoRule(title, group, due_date, comment)
     except ValueError as e:
         click.echo(e, err=True)
         return 1
-    else:
-        click.echo(f"Created #{id} {title}")
+    manager.append(rule)
     manager.save()
+    # the id may have changed if another process created a TODO meanwhile
+    click.echo(f"Created #{rule.id} {title}")
 
 
-@main.command(help="Edit messages, or moves a TODO to another group.")
-@click.argument("id", type=int)
+@main.command(
+    help="Edit messages, or moves TODOs to another group. Several TODOs can be"
+    " edited at once with the field options. " + IDS_HELP
+)
+@click.argument("ids", nargs=-1, required=True)
 @click.option(
     "-i", "--interactive", is_flag=True, help="Create on this shell interactively."
 )
+@click.option("--title", "new_title", help="Set the title.")
+@click.option("--group", "new_group", help="Set the group.")
+@click.option(
+    "--due",
+    "new_due_date",
+    help='Set the due date, and recurrence like "daily" ("" to unset).',
+)
+@click.option("--comment", "new_comment", help="Set the comment.")
 @click.pass_context
-def edit(ctx: click.Context, id, interactive: bool):
+def edit(
+    ctx: click.Context,
+    ids: tuple[str, ...],
+    interactive: bool,
+    new_title: str | None,
+    new_group: str | None,
+    new_due_date: str | None,
+    new_comment: str | None,
+):
     manager: Manager = ctx.obj
+    id_list = read_ids(ids)
+
+    if (new_title, new_group, new_due_date, new_comment) != (None,) * 4:
+
+        def edit_fields(id: int):
+            item = manager.info(id)
+            due_date = item.due_text()
+            rule = TodoRule(
+                item.title if new_title is None else new_title,
+                item.group if new_group is None else new_group,
+                due_date if new_due_date is None else new_due_date,
+                item.comment if new_comment is None else new_comment,
+                status=item.status,
+            )
+            manager.update(id, rule)
+
+        exit_on_failure(ctx, for_each(id_list, edit_fields))
+        return 0
+
+    if len(id_list) != 1:
+        click.echo("Use the field options to edit several TODOs at once.", err=True)
+        ctx.exit(1)
+    id = id_list[0]
+
     try:
         item = manager.info(id)
     except KeyError as e:
@@ -121,9 +274,7 @@ def edit(ctx: click.Context, id, interactive: bool):
     if interactive:
         title: str = click.prompt("title", default=item.title)
         group: str = click.prompt("group", default=item.group)
-        due_date: str = click.prompt(
-            "due date", default=item.due_date.isoformat() if item.due_date else ""
-        )
+        due_date: str = click.prompt("due date", default=item.due_text())
         comment = item.comment
     else:
         txt = click.edit(item.fmt_editor() + "\n" + EDITOR_HELP)
@@ -137,61 +288,190 @@ def edit(ctx: click.Context, id, interactive: bool):
             return 1
 
     try:
-        manager.update(id, TodoRule(title, group, due_date, comment))
+        # saving the editor unchanged writes nothing
+        manager.update(
+            id, TodoRule(title, group, due_date, comment, status=item.status)
+        )
     except ValueError as e:
         click.echo(e, err=True)
         return 1
-    else:
-        manager.save()
 
 
-@main.command(help="Mark a TODO as completed.")
-@click.argument("id", type=int)
+@main.command(help="Mark TODOs as completed. " + IDS_HELP)
+@click.argument("ids", nargs=-1, required=True)
 @click.option(
     "-c",
     "--completed",
     "status",
     flag_value="completed",
     default=True,
-    help="Mark the TODO as completed. (default)",
+    help="Mark the TODOs as completed. (default)",
 )
 @click.option(
     "-u",
     "--uncompleted",
     "status",
     flag_value="uncompleted",
-    help="Mark the TODO as uncompleted instead.",
+    help="Mark the TODOs as uncompleted instead.",
 )
 @click.option(
     "-p",
     "--not-planed",
     "status",
     flag_value="not-planed",
-    help="Mark the TODO as not-planed instead. Useful if you want to skip one of the scheduled TODO series.",
+    help="Mark the TODOs as not-planed instead. Useful if you want to skip one of the scheduled TODO series.",
+)
+@click.option(
+    "--date",
+    "-d",
+    help="Mark only the occurrence of scheduled TODOs on the date.",
 )
 @click.pass_context
-def mark(ctx: click.Context, id: int, status: str):
+def mark(ctx: click.Context, ids: tuple[str, ...], status: str, date: str | None):
     manager: Manager = ctx.obj
     try:
-        manager.mark(id, status)
-    except KeyError as e:
-        click.echo(e, err=True)
-        return 1
+        day = parse_date(date) if date else None
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint="--date")
+    failed = for_each(read_ids(ids), lambda id: manager.mark(id, status, day))
+    exit_on_failure(ctx, failed)
+
+
+@main.command(
+    help="Remove TODOs. If it is scheduled, all related TODOs are removed. " + IDS_HELP
+)
+@click.argument("ids", nargs=-1, required=True)
+@click.option("-y", "--yes", is_flag=True, help="Remove without confirmation.")
+@click.pass_context
+def remove(ctx: click.Context, ids: tuple[str, ...], yes: bool):
+    manager: Manager = ctx.obj
+    titles: dict[int, str] = {}
+
+    def find(id: int):
+        titles[id] = manager.info(id).title
+
+    failed = for_each(read_ids(ids), find)
+    if len(titles) == 1:
+        [(id, title)] = titles.items()
+        prompt = f"Do you want to remove #{id} {title}"
     else:
-        manager.save()
+        prompt = f"Do you want to remove {len(titles)} TODOs"
 
+    if titles and (yes or click.confirm(prompt)):
+        for id in titles:
+            manager.remove(id)
+    exit_on_failure(ctx, failed)
 
-@main.command(help="Remove a TODO. If it is scheduled, all related TODOs are removed.")
-@click.argument("id", type=int)
+
+@main.command(
+    name="import", help="Create TODOs from a JSON Lines or CSV file (- for stdin)."
+)
+@click.argument("file", type=click.Path(dir_okay=False, allow_dash=True))
+@click.option(
+    "-f",
+    "--format",
+    type=click.Choice(FORMATS),
+    help="Format of the file. Guessed from its extension by default.",
+)
+@click.pass_context
+def import_(ctx: click.Context, file: str, format: str | None):
+    manager: Manager = ctx.obj
+    with open_text(file, "r") as f:
+        try:
+            rules = [*read_rules(f, format or guess_format(file))]
+        except ValueError as e:
+            click.echo(e, err=True)
+            ctx.exit(1)
+
+    ids = manager.extend(rules)
+    click.echo(f"Imported {len(ids)} TODOs")
+
+
+@main.command(help="Write all TODOs to a JSON Lines or CSV file (- for stdout).")
+@click.argument("file", type=click.Path(dir_okay=False, allow_dash=True), default="-")
+@click.option(
+    "-f",
+    "--format",
+    type=click.Choice(FORMATS),
+    help="Format of the file. Guessed from its extension by default.",
+)
 @click.pass_context
-def remove(ctx: click.Context, id: int):
+def export(ctx: click.Context, file: str, format: str | None):
+    manager: Manager = ctx.obj
+    with open_text(file, "w") as f:
+        write_rules(f, format or guess_format(file), manager.iter_rules())
+
+
+@main.command(
+    help="Move completed and not-planed TODOs due before a date, and those without"
+    " a due date, out of the data file into monthly archive files. Only the"
+    " commands which may show them read the archive; search and groups leave it"
+    " out. Changing an archived TODO brings it back."
+)
+@click.option(
+    "--before",
+    "-b",
+    default="today",
+    show_default=True,
+    help="Archive TODOs due before this date.",
+)
+@click.pass_context
+def archive(ctx: click.Context, before: str):
     manager: Manager = ctx.obj
     try:
-        title = manager.info(id).title
-    except KeyError as e:
-        click.echo(e, err=True)
+        count = manager.archive(parse_date(before))
+    except ValueError as e:
+        ctx.fail(str(e))
+    click.echo(f"Archived {count} TODOs.")
+
+
+@main.command(
+    help="Keep TODOs in memory and answer the other commands through a socket."
+    " They read the data file themselves while it isn't running."
+)
+@click.pass_context
+def serve(ctx: click.Context):
+    if connect() is not None:
+        click.echo("The daemon is already running.", err=True)
         return 1
+    click.echo("Serving TODOs, stop with Ctrl-C")
+    serve_forever(ctx.obj)
+
+
+def open_text(path: str, mode: str) -> TextIO:
+    if path == "-":
+        stream = click.get_text_stream("stdin" if mode == "r" else "stdout")
+        # don't close the standard streams when leaving the with block
+        return contextlib.nullcontext(stream)  # type: ignore
+    return open(path, mode, newline="")
+
+
+def read_ids(args: tuple[str, ...]) -> list[int]:
+    if "-" in args:
+        stdin = click.get_text_stream("stdin").read().split()
+        args = tuple(arg for arg in args if arg != "-") + tuple(stdin)
+    try:
+        return parse_ids(args)
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint="IDS")
+
+
+def for_each(ids: list[int], action: Callable[[int], None]) -> int:
+    # Applies `action` to every ID, reporting failures one by one. Returns the
+    # number of failures.
+    failed = 0
+    for id in ids:
+        try:
+            action(id)
+        except (KeyError, ValueError) as e:
+            click.echo(e, err=True)
+            failed += 1
+    return failed
+
 
-    if click.confirm(f"Do you want to remove #{id} {title}"):
-        manager.remove(id)
-        manager.save()
+def exit_on_failure(ctx: click.Context, failed: int) -> None:
+    # Exits with status 1 if any ID failed, once the changes made to the
+    # others are written. The return value of a command is not its status.
+    if failed:
+        ctx.find_root().close()
+        ctx.exit(1)
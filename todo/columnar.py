@@ -0,0 +1,140 @@
+from __future__ import annotations
+import datetime
+import operator
+from array import array
+from typing import Iterable, Sequence
+
+from .parser import parse_date
+from .rule import TodoRule
+from .snapshot import STATUS_CODES
+
+try:
+    import numpy
+except ImportError:
+    # the columns are then plain arrays, filtered one row at a time
+    numpy = None
+
+
+# Ordinal of the rows without a due date, which sorts them first
+NO_DATE = 0
+
+Mask = Sequence[bool]
+
+
+class Table:
+    # Column-wise copy of TODOs, row i holding rules[i]. Filters return
+    # boolean masks over the rows, NumPy arrays if it is installed. Recurring
+    # TODOs are single rows due on their first occurrence.
+    rules: list[TodoRule]
+    ids: Sequence[int]
+    statuses: Sequence[int]  # see STATUS_CODES
+    due: Sequence[int]  # ordinals, NO_DATE if none
+    groups: Sequence[int]  # indexes of group_names
+    group_names: list[str]
+    group_index: dict[str, int]
+
+    def __init__(self, rules: Iterable[TodoRule]) -> None:
+        self.rules = sorted(rules, key=lambda rule: rule.id)
+        self.group_names = []
+        self.group_index = {}
+        ids = array("q", (rule.id for rule in self.rules))
+        statuses = array("b", (STATUS_CODES[rule.status] for rule in self.rules))
+        due = array(
+            "i",
+            (
+                rule.due_date.toordinal() if rule.due_date else NO_DATE
+                for rule in self.rules
+            ),
+        )
+        groups = array("i", (self._group_id(rule.group) for rule in self.rules))
+
+        if numpy is None:
+            self.ids, self.statuses, self.due, self.groups = ids, statuses, due, groups
+        else:
+            self.ids = numpy.frombuffer(ids, dtype=numpy.int64)
+            self.statuses = numpy.frombuffer(statuses, dtype=numpy.int8)
+            self.due = numpy.frombuffer(due, dtype=numpy.int32)
+            self.groups = numpy.frombuffer(groups, dtype=numpy.int32)
+
+    def __len__(self) -> int:
+        return len(self.rules)
+
+    def mask(
+        self,
+        status: str | None = None,
+        start: datetime.date | None = None,
+        end: datetime.date | None = None,
+        group: str | None = None,
+    ) -> Mask:
+        # Rows matching every given criterion. `start` and `end` are both
+        # inclusive and exclude the rows without a due date.
+        conditions = []
+        if status is not None:
+            conditions.append((self.statuses, operator.eq, STATUS_CODES[status]))
+        if start is not None or end is not None:
+            conditions.append((self.due, operator.ne, NO_DATE))
+        if start is not None:
+            conditions.append((self.due, operator.ge, start.toordinal()))
+        if end is not None:
+            conditions.append((self.due, operator.le, end.toordinal()))
+        if group is not None:
+            conditions.append(
+                (self.groups, operator.eq, self.group_index.get(group, -1))
+            )
+
+        if numpy is not None:
+            mask = numpy.ones(len(self), dtype=bool)
+            for column, compare, value in conditions:
+                mask &= compare(column, value)
+            return mask
+
+        rows = range(len(self))
+        for column, compare, value in conditions:
+            rows = [i for i in rows if compare(column[i], value)]
+        mask = [False] * len(self)
+        for i in rows:
+            mask[i] = True
+        return mask
+
+    def count(self, mask: Mask) -> int:
+        if numpy is not None:
+            return int(numpy.count_nonzero(mask))
+        return sum(mask)
+
+    def order(self, mask: Mask, reverse: bool = False) -> Sequence[int]:
+        # Indexes of the rows in `mask` in the order of Manager.instances:
+        # undated rows by id, then the others by (due date, id), reversed if
+        # `reverse` is set.
+        if numpy is not None:
+            rows = numpy.flatnonzero(mask)
+            due = self.due[rows]
+            undated = rows[due == NO_DATE]
+            dated = rows[due != NO_DATE]
+            # sorted by due date, then by id
+            dated = dated[numpy.lexsort((self.ids[dated], self.due[dated]))]
+            return numpy.concatenate((undated, dated[::-1] if reverse else dated))
+
+        rows = [i for i, selected in enumerate(mask) if selected]
+        undated = [i for i in rows if self.due[i] == NO_DATE]
+        dated = sorted(
+            (i for i in rows if self.due[i] != NO_DATE),
+            key=lambda i: (self.due[i], self.ids[i]),
+            reverse=reverse,
+        )
+        return undated + dated
+
+    def select(self, mask: Mask, reverse: bool = False) -> list[TodoRule]:
+        return [self.rules[i] for i in self.order(mask, reverse)]
+
+    def instances(self, date: str | None, status: str) -> list[TodoRule]:
+        # Same result as Manager.instances, but for recurring TODOs
+        day = parse_date(date) if date else None
+        mask = self.mask(status, day, day)
+        return self.select(mask, reverse=status != "uncompleted")
+
+    def _group_id(self, group: str) -> int:
+        id = self.group_index.get(group)
+        if id is None:
+            id = self.group_index[group] = len(self.group_names)
+            self.group_names.append(group)
+        return id
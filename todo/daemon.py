@@ -0,0 +1,276 @@
+from __future__ import annotations
+import datetime
+import json
+import logging
+import signal
+import socket
+import socketserver
+import sys
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Callable, Iterable, Iterator
+
+from .rule import TodoRule, decode_date
+from .utils import freeze_today
+
+if TYPE_CHECKING:
+    from .groups import Summary
+    from .manager import Manager
+    from .sqlite import SqliteManager
+
+
+SOCKET_PATH = Path.home() / Path(".local/share/todo/todo.sock")
+
+logger = logging.getLogger(__name__)
+
+# Seconds a session may stay idle before the daemon ends it
+SESSION_TIMEOUT = 60.0
+
+# Requests are one JSON line {"method": ..., "args": [...]}, answered by one
+# JSON line {"result": ...} or {"error": exception name, "message": ...}.
+# TODOs travel in the form of TodoRule.into_dict. A connection may carry several
+# requests, as a session which has the daemon to itself until it ends: the
+# mutations it didn't save are then discarded.
+METHODS: dict[str, Callable[..., Any]] = {
+    "iter_instances": lambda manager, *args: [
+        rule.into_dict() for rule in manager.iter_instances(*args)
+    ],
+    "iter_query": lambda manager, *args: [
+        rule.into_dict() for rule in manager.iter_query(*args)
+    ],
+    "iter_rules": lambda manager: [rule.into_dict() for rule in manager.iter_rules()],
+    "search": lambda manager, query, limit=None: [
+        rule.into_dict() for rule in manager.search(query, limit)
+    ],
+    "groups": lambda manager: manager.groups(),
+    "info": lambda manager, id: manager.info(id).into_dict(),
+    "append": lambda manager, record: manager.append(TodoRule.from_record(record)),
+    "extend": lambda manager, records: manager.extend(
+        map(TodoRule.from_record, records)
+    ),
+    "update": lambda manager, id, record: manager.update(
+        id, TodoRule.from_record(record)
+    ),
+    "mark": lambda manager, id, status, date=None: manager.mark(
+        id, status, decode_date(date)
+    ),
+    "remove": lambda manager, id: manager.remove(id),
+    "archive": lambda manager, before: manager.archive(decode_date(before)),
+    "save": lambda manager: manager.save(),
+    "discard": lambda manager: manager.discard(),
+}
+
+ERRORS = {"KeyError": KeyError, "ValueError": ValueError}
+
+
+class RemoteManager:
+    # Same interface as Manager, backed by the one kept in memory by a daemon.
+    # Mutations open a session, which the next save or discard ends, so that
+    # other clients neither see nor write them before.
+    socket_path: Path
+    session: socket.socket | None
+    dirty: bool  # whether mutations were sent since the last save
+
+    def __init__(self, socket_path: Path) -> None:
+        self.socket_path = socket_path
+        self.session = None
+        self.dirty = False
+
+    def __enter__(self) -> RemoteManager:
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        if exc_info[0] is None:
+            self.save()
+        else:
+            self.discard()
+
+    def instances(self, date: str | None, status: str) -> list[TodoRule]:
+        return list(self.iter_instances(date, status))
+
+    def iter_instances(
+        self,
+        date: str | None,
+        status: str,
+        limit: int | None = None,
+        offset: int = 0,
+    ) -> Iterator[TodoRule]:
+        records = self._call("iter_instances", date, status, limit, offset)
+        return map(TodoRule.from_record, records)
+
+    def iter_query(
+        self,
+        expr: str,
+        status: str,
+        limit: int | None = None,
+        offset: int = 0,
+    ) -> Iterator[TodoRule]:
+        records = self._call("iter_query", expr, status, limit, offset)
+        return map(TodoRule.from_record, records)
+
+    def iter_rules(self) -> Iterator[TodoRule]:
+        return map(TodoRule.from_record, self._call("iter_rules"))
+
+    def search(self, query: str, limit: int | None = None) -> list[TodoRule]:
+        return list(map(TodoRule.from_record, self._call("search", query, limit)))
+
+    def groups(self) -> list[Summary]:
+        return [tuple(row) for row in self._call("groups")]
+
+    def info(self, id: int) -> TodoRule:
+        return TodoRule.from_record(self._call("info", id))
+
+    def save(self) -> None:
+        if self.dirty:
+            try:
+                self._call("save")
+            finally:
+                self._end()
+
+    def discard(self) -> None:
+        if self.dirty:
+            try:
+                self._call("discard")
+            finally:
+                self._end()
+
+    def append(self, rule: TodoRule) -> int:
+        self._begin()
+        rule.id = self._call("append", rule.into_dict())
+        return rule.id
+
+    def extend(self, rules: Iterable[TodoRule]) -> list[int]:
+        rules = list(rules)
+        self._begin()
+        ids = self._call("extend", [rule.into_dict() for rule in rules])
+        for rule, id in zip(rules, ids):
+            rule.id = id
+        return ids
+
+    def update(self, id: int, rule: TodoRule):
+        rule.id = id
+        self._begin()
+        self._call("update", id, rule.into_dict())
+
+    def mark(self, id: int, status: str, date: datetime.date | None = None):
+        self._begin()
+        self._call("mark", id, status, date.isoformat() if date else None)
+
+    def remove(self, id: int):
+        self._begin()
+        self._call("remove", id)
+
+    def archive(self, before: datetime.date) -> int:
+        # written by the daemon right away
+        return self._call("archive", before.isoformat())
+
+    def _begin(self):
+        if self.session is None:
+            self.session = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.session.connect(str(self.socket_path))
+        self.dirty = True
+
+    def _end(self):
+        if self.session is not None:
+            self.session.close()
+            self.session = None
+        self.dirty = False
+
+    def _call(self, method: str, *args) -> Any:
+        if self.session is not None:
+            response = request(self.session, method, args)
+        else:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                sock.connect(str(self.socket_path))
+                response = request(sock, method, args)
+
+        if "error" in response:
+            raise ERRORS.get(response["error"], RuntimeError)(response["message"])
+        return response["result"]
+
+
+class Handler(socketserver.StreamRequestHandler):
+    server: Server
+
+    def handle(self):
+        # Clients only checking that the daemon is running send nothing
+        self.connection.settimeout(SESSION_TIMEOUT)
+        try:
+            for line in self.rfile:
+                self.wfile.write(json.dumps(self.answer(line)).encode() + b"\n")
+        except OSError as e:
+            logger.warning("session ended: %s", e)
+        finally:
+            # the client failed or went away before saving
+            self.server.manager.discard()
+
+    def answer(self, line: bytes) -> dict:
+        try:
+            request = json.loads(line)
+            method = METHODS.get(request["method"])
+            if method is None:
+                raise ValueError(f"Unknown method: {request['method']}")
+            # a single date for each request, however long the daemon runs
+            freeze_today(datetime.date.today())
+            self.server.manager.refresh()
+            response = {"result": method(self.server.manager, *request["args"])}
+        except (KeyError, ValueError) as e:
+            response = {
+                "error": type(e).__name__,
+                "message": e.args[0] if e.args else str(e),
+            }
+        except Exception as e:
+            logger.exception("failed to handle %r", line)
+            response = {"error": type(e).__name__, "message": str(e)}
+        finally:
+            freeze_today(None)
+        return response
+
+
+class Server(socketserver.UnixStreamServer):
+    # Sessions are handled one at a time, so the manager needs no locking
+    manager: Manager | SqliteManager
+
+    def __init__(self, manager: Manager | SqliteManager, socket_path: Path) -> None:
+        self.manager = manager
+        socket_path.parent.mkdir(parents=True, exist_ok=True)
+        # left behind by a daemon which was killed
+        socket_path.unlink(missing_ok=True)
+        super().__init__(str(socket_path), Handler)
+        socket_path.chmod(0o600)
+
+
+def request(sock: socket.socket, method: str, args: tuple) -> dict:
+    sock.sendall(json.dumps({"method": method, "args": args}).encode() + b"\n")
+    # The answer is the only line the daemon sends until the next request
+    chunks: list[bytes] = []
+    while not chunks or not chunks[-1].endswith(b"\n"):
+        chunk = sock.recv(1 << 16)
+        if not chunk:
+            raise ConnectionError("The daemon closed the connection.")
+        chunks.append(chunk)
+    return json.loads(b"".join(chunks))
+
+
+def connect(socket_path: Path = SOCKET_PATH) -> RemoteManager | None:
+    # Returns None unless a daemon is listening on `socket_path`
+    if not socket_path.exists():
+        return None
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(str(socket_path))
+        except (ConnectionRefusedError, FileNotFoundError):
+            return None
+    return RemoteManager(socket_path)
+
+
+def serve(manager: Manager | SqliteManager, socket_path: Path = SOCKET_PATH) -> None:
+    # Serves until interrupted or terminated
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    with Server(manager, socket_path) as server:
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            manager.save()
+            socket_path.unlink(missing_ok=True)
@@ -0,0 +1,106 @@
+import csv
+import datetime
+import json
+from typing import Iterable, Iterator, TextIO
+
+from .rule import STATUSES, TodoRule
+from .storage import SCHEMA
+
+
+FORMATS = ["jsonl", "csv"]
+FIELDS = [
+    "id",
+    "title",
+    "group",
+    "due_date",
+    "comment",
+    "status",
+    "recurrence",
+    "overrides",
+]
+
+
+def guess_format(filename: str) -> str:
+    return "csv" if filename.lower().endswith(".csv") else "jsonl"
+
+
+def read_rules(f: TextIO, format: str) -> Iterator[TodoRule]:
+    # Rules read from `f` have no id yet. Raises ValueError with the line
+    # number of the first invalid record.
+    if format == "csv":
+        reader = csv.DictReader(f)
+        rows = ((reader.line_num, row) for row in reader)
+    else:
+        rows = ((i, line) for i, line in enumerate(f, start=1) if line.strip())
+
+    for line, row in rows:
+        try:
+            record = row if format == "csv" else json.loads(row)
+            if not isinstance(record, dict):
+                raise ValueError("Expected an object.")
+            yield record_to_rule(record)
+        except ValueError as e:
+            raise ValueError(f"line {line}: {e}") from e
+
+
+def write_rules(f: TextIO, format: str, rules: Iterable[TodoRule]) -> int:
+    count = 0
+    if format == "csv":
+        writer = csv.DictWriter(f, FIELDS)
+        writer.writeheader()
+        for rule in rules:
+            record = rule.into_dict()
+            if "overrides" in record:
+                record["overrides"] = json.dumps(record["overrides"])
+            writer.writerow(record)
+            count += 1
+    else:
+        for rule in rules:
+            f.write(json.dumps(rule.into_dict()) + "\n")
+            count += 1
+    return count
+
+
+def record_to_rule(record: dict) -> TodoRule:
+    check_types(record)
+    title = record.get("title") or ""
+    if title == "":
+        raise ValueError("Title is not given.")
+    status = record.get("status") or "uncompleted"
+    if status not in STATUSES:
+        raise ValueError(f"Unknown status: {status}")
+
+    due_date = record.get("due_date") or ""
+    if record.get("recurrence"):
+        due_date = f"{due_date} {record['recurrence']}".strip()
+    rule = TodoRule(
+        title,
+        record.get("group") or "",
+        due_date,
+        record.get("comment") or "",
+        status=status,
+    )
+
+    overrides = record.get("overrides") or {}
+    if isinstance(overrides, str):
+        # a JSON object in CSV files
+        overrides = json.loads(overrides)
+    if not isinstance(overrides, dict):
+        raise ValueError(f"Invalid overrides: {overrides!r}")
+    for day, override in overrides.items():
+        rule.set_override(datetime.date.fromisoformat(day), override)
+    return rule
+
+
+def check_types(record: dict) -> None:
+    # Like storage.validate, for records which may miss fields or leave them
+    # empty. Ids are ignored, and CSV files hold overrides as JSON strings.
+    for field, value in record.items():
+        if field == "id" or value is None or value == "":
+            continue
+        if field not in SCHEMA:
+            raise ValueError(f"Unknown field: {field}")
+        if field == "overrides" and isinstance(value, str):
+            continue
+        if not isinstance(value, SCHEMA[field]) or isinstance(value, bool):
+            raise ValueError(f"Invalid {field}: {value!r}")
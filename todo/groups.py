@@ -0,0 +1,136 @@
+from __future__ import annotations
+import datetime
+import json
+from collections import Counter
+from pathlib import Path
+from typing import Iterable
+
+from .rule import STATUSES, TodoRule
+from .utils import atomic_write, file_stamp
+
+
+# Groups are paths such as work/infra/db, each segment a subgroup of the former
+SEPARATOR = "/"
+VERSION = 2
+
+# (group, count by status, overdue count) of a subtree
+Summary = tuple[str, dict[str, int], int]
+
+
+def ancestors(group: str) -> list[str]:
+    # The group and the groups above it, outermost first
+    parts = group.split(SEPARATOR)
+    return [SEPARATOR.join(parts[: i + 1]) for i in range(len(parts))]
+
+
+def pending_date(rule: TodoRule) -> datetime.date | None:
+    # When the TODO is next due while uncompleted: its due date, or the first
+    # uncompleted occurrence of a series
+    if rule.recurrence:
+        occurrence = next(rule.iter_occurrences("uncompleted"), None)
+        return occurrence.due_date if occurrence else None
+    if rule.status == "uncompleted":
+        return rule.due_date
+    return None
+
+
+class GroupStats:
+    __slots__ = ("counts", "pending")
+
+    counts: Counter[str]  # by status, recurring TODOs once
+    pending: Counter[int]  # ordinals of pending_date -> number of TODOs
+
+    def __init__(self) -> None:
+        self.counts = Counter()
+        self.pending = Counter()
+
+    def overdue(self, day: datetime.date) -> int:
+        ordinal = day.toordinal()
+        return sum(n for due, n in self.pending.items() if due < ordinal)
+
+
+class GroupTree:
+    # Aggregates of every subtree of groups, kept up to date as TODOs are
+    # added and discarded, so that summaries don't visit the TODOs
+    nodes: dict[str, GroupStats]
+
+    def __init__(self, rules: Iterable[TodoRule] = ()) -> None:
+        self.nodes = {}
+        for rule in rules:
+            self.add(rule)
+
+    def add(self, rule: TodoRule):
+        self.tally(rule.group, rule.status, pending_date(rule), 1)
+
+    def discard(self, rule: TodoRule):
+        # `rule` must be as it was added
+        self.tally(rule.group, rule.status, pending_date(rule), -1)
+
+    def tally(
+        self, group: str, status: str, pending: datetime.date | None, n: int
+    ) -> None:
+        for path in ancestors(group):
+            stats = self.nodes.get(path)
+            if stats is None:
+                stats = self.nodes[path] = GroupStats()
+            # entries dropping to zero are removed, along with empty groups
+            stats.counts[status] += n
+            if stats.counts[status] == 0:
+                del stats.counts[status]
+            if pending is not None:
+                ordinal = pending.toordinal()
+                stats.pending[ordinal] += n
+                if stats.pending[ordinal] == 0:
+                    del stats.pending[ordinal]
+            if not stats.counts:
+                del self.nodes[path]
+
+    def summary(self, day: datetime.date) -> list[Summary]:
+        # Every subtree, each followed by its subgroups, with its TODOs overdue
+        # on `day`
+        nodes = sorted(self.nodes.items(), key=lambda item: item[0].split(SEPARATOR))
+        return [
+            (
+                path,
+                {status: stats.counts[status] for status in STATUSES},
+                stats.overdue(day),
+            )
+            for path, stats in nodes
+        ]
+
+    def into_dict(self) -> dict:
+        return {
+            path: {"counts": dict(stats.counts), "pending": dict(stats.pending)}
+            for path, stats in self.nodes.items()
+        }
+
+    @classmethod
+    def from_dict(cls, d: dict) -> GroupTree:
+        tree = cls()
+        for path, record in d.items():
+            stats = tree.nodes[path] = GroupStats()
+            stats.counts.update(record["counts"])
+            stats.pending.update({int(k): n for k, n in record["pending"].items()})
+        return tree
+
+
+def read_groups(path: Path, source: Path) -> GroupTree | None:
+    # Returns None unless `path` exists and was built along the current
+    # `source`, like read_snapshot
+    try:
+        with path.open("rb") as f:
+            record = json.load(f)
+        stamp = file_stamp(source)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    if record.get("source") != [VERSION, *stamp]:
+        return None
+    return GroupTree.from_dict(record["groups"])
+
+
+def write_groups(path: Path, source: Path, tree: GroupTree) -> None:
+    record = {
+        "source": [VERSION, *file_stamp(source)],
+        "groups": tree.into_dict(),
+    }
+    atomic_write(path, json.dumps(record).encode())
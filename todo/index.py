@@ -0,0 +1,107 @@
+import bisect
+import datetime
+from collections import defaultdict
+from typing import Iterable, Iterator
+
+from .rule import TodoRule
+
+
+class SortIndex:
+    # Rules of each status in listing order: those without a due date sorted
+    # by id, and the others sorted by (due date, id).
+    undated: defaultdict[str, list[tuple[int, TodoRule]]]
+    dated: defaultdict[str, list[tuple[int, int, TodoRule]]]
+    # Recurring rules, also listed above by their first occurrence
+    recurring: dict[int, TodoRule]
+    groups: defaultdict[str, dict[int, TodoRule]]  # group -> id -> rule
+
+    def __init__(self, rules: Iterable[TodoRule] = ()) -> None:
+        self.undated = defaultdict(list)
+        self.dated = defaultdict(list)
+        self.recurring = {}
+        self.groups = defaultdict(dict)
+        for rule in rules:
+            self.groups[rule.group][rule.id] = rule
+            if rule.recurrence:
+                self.recurring[rule.id] = rule
+            if rule.due_date:
+                self.dated[rule.status].append(
+                    (rule.due_date.toordinal(), rule.id, rule)
+                )
+            else:
+                self.undated[rule.status].append((rule.id, rule))
+        for entries in self.dated.values():
+            entries.sort(key=lambda entry: entry[:2])
+        for entries in self.undated.values():
+            entries.sort(key=lambda entry: entry[0])
+
+    def add(self, rule: TodoRule):
+        self.groups[rule.group][rule.id] = rule
+        if rule.recurrence:
+            self.recurring[rule.id] = rule
+        if rule.due_date:
+            entry = (rule.due_date.toordinal(), rule.id, rule)
+            bisect.insort(self.dated[rule.status], entry, key=lambda e: e[:2])
+        else:
+            entry = (rule.id, rule)
+            bisect.insort(self.undated[rule.status], entry, key=lambda e: e[0])
+
+    def discard(self, rule: TodoRule, status: str | None = None):
+        # `status` is the status the rule was indexed with, if it has changed
+        status = status or rule.status
+        self.recurring.pop(rule.id, None)
+        members = self.groups.get(rule.group)
+        if members is not None:
+            members.pop(rule.id, None)
+            if not members:
+                del self.groups[rule.group]
+        if rule.due_date:
+            entries = self.dated[status]
+            key = (rule.due_date.toordinal(), rule.id)
+            i = bisect.bisect_left(entries, key, key=lambda e: e[:2])
+            if i < len(entries) and entries[i][:2] == key:
+                entries.pop(i)
+        else:
+            entries = self.undated[status]
+            i = bisect.bisect_left(entries, rule.id, key=lambda e: e[0])
+            if i < len(entries) and entries[i][0] == rule.id:
+                entries.pop(i)
+
+    def iter_undated(self, status: str) -> Iterator[TodoRule]:
+        return (entry[1] for entry in self.undated[status])
+
+    def iter_dated(
+        self,
+        status: str,
+        start: datetime.date | None = None,
+        end: datetime.date | None = None,
+        reverse: bool = False,
+    ) -> Iterator[TodoRule]:
+        # Rules due between `start` and `end`, both inclusive
+        entries = self.dated[status]
+        lo = 0
+        hi = len(entries)
+        if start:
+            lo = bisect.bisect_left(entries, start.toordinal(), key=lambda e: e[0])
+        if end:
+            hi = bisect.bisect_right(entries, end.toordinal(), key=lambda e: e[0])
+
+        indices = range(hi - 1, lo - 1, -1) if reverse else range(lo, hi)
+        return (entries[i][2] for i in indices)
+
+    def count(self, status: str) -> int:
+        return len(self.undated[status]) + len(self.dated[status])
+
+    def members(self, patterns: list[str]) -> dict[int, TodoRule]:
+        # Rules in any of the groups, or groups beginning with the patterns
+        # ending with *
+        out: dict[int, TodoRule] = {}
+        for pattern in patterns:
+            if pattern.endswith("*"):
+                prefix = pattern[:-1]
+                for group, members in self.groups.items():
+                    if group.startswith(prefix):
+                        out.update(members)
+            else:
+                out.update(self.groups.get(pattern, {}))
+        return out
@@ -1,83 +1,699 @@
+from __future__ import annotations
 import datetime
+import heapq
+import itertools
+import logging
 from pathlib import Path
-import yaml
+from typing import TYPE_CHECKING, Iterable, Iterator
 
+from .groups import GroupTree, Summary, pending_date
+from .index import SortIndex
+from .parallel import load_files
 from .parser import parse_date
-from .rule import TodoRule
+from .query import Query, compile_query
+from .rule import TodoRule, decode_date
+from .search import SearchIndex
+from .snapshot import Snapshot
+from .storage import JOURNAL_LIMIT, Store, shard_name
+from .utils import today
+
+if TYPE_CHECKING:
+    from .columnar import Table
 
 
 DATA_PATH = Path.home() / Path(".local/share/todo/data.yaml")
 
+logger = logging.getLogger(__name__)
+
 
 class Manager:
-    data: list[TodoRule]
+    data: dict[int, TodoRule]  # by id, in ascending order of id
     next_id: int
+    store: Store
+    journal: list[dict]  # mutations not written yet
+    journal_size: int  # number of records in the journal file
+    version: tuple  # of the store when it was loaded, see Store.version
+    lazy: bool
+    # Mapped binary snapshot whose records are loaded into `data` on demand,
+    # except those in `taken` which were loaded or removed already. Always None
+    # unless the manager is lazy.
+    snapshot: Snapshot | None
+    taken: set[int]
+    # Built on the first listing, then kept up to date by every mutation
+    sort_index: SortIndex | None
+    # Likewise on the first search, from the index persisted along the
+    # snapshot and the TODOs changed since, see journal_ids
+    search_index: SearchIndex | None
+    journal_ids: set[int]  # of the TODOs created, edited or removed in the journal
+    # Read along the snapshot, or built on the first summary, then kept up to
+    # date by every mutation
+    group_tree: GroupTree | None
+    # Finished TODOs moved out of the data file, see Archive. Their shards are
+    # loaded into `data` as commands need them, but stay out of the data file
+    # and of the indexes above unless they change, which restores them.
+    shards: set[str]  # loaded already
+    archived: dict[int, str]  # shard of the TODOs in `data` loaded from shards
+    restored: set[int]  # ids to drop from their shards on save
+
+    def __init__(self, path: Path | None = None, lazy: bool = False) -> None:
+        self.store = Store(path or DATA_PATH)
+        self.journal = []
+        self.lazy = lazy
+        with self.store.lock(shared=True):
+            self._load()
 
-    def __init__(self) -> None:
-        self.data = []
+    def _load(self):
+        self.data = {}
         self.next_id = 1
+        self.snapshot = None
+        self.taken = set()
+        self.sort_index = None
+        self.search_index = None
+        self.group_tree = None
+        self.shards = set()
+        self.archived = {}
+        self.restored = set()
 
-        if not DATA_PATH.exists():
-            return
+        snapshot = self.store.read_binary(mapped=self.lazy)
+        if snapshot is None:
+            # The YAML file is the source of truth. Its binary copy is
+            # missing or stale, so rebuild it for the next runs.
+            (rules,) = load_files([self.store.path], self.store.loader)
+            for rule in rules:
+                self._insert(rule)
+            group_tree = GroupTree(self.data.values())
+            if self.store.path.exists():
+                self.store.write_binary(self.data.values())
+                self.store.write_groups(group_tree)
+        else:
+            if self.lazy:
+                self.snapshot = snapshot
+                self.next_id = snapshot.max_id() + 1
+            else:
+                for fields in snapshot:
+                    self._insert(TodoRule.from_fields(*fields))
+            group_tree = self.store.read_groups()
+        # kept up to date by the journal from here
+        self.group_tree = group_tree
+        self.store.archive.read_manifest()
+        self.next_id = max(self.next_id, self.store.archive.max_id + 1)
+        ops = self.store.load_journal()
+        for op in ops:
+            self._replay(op)
+        self.journal_size = len(ops)
+        self.journal_ids = {op_id(op) for op in ops if op["op"] != "mark"}
+        self.version = self.store.version()
 
-        with DATA_PATH.open("r") as f:
-            raw_data = yaml.load(f, yaml.Loader)
-        for d in raw_data:
-            rule = TodoRule(**d)
-            self.data.append(rule)
-            self.next_id = max(self.next_id, d["id"] + 1)
+    def __enter__(self) -> Manager:
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        # all the mutations of the block go in a single write, or none of them
+        # if it raised
+        if exc_info[0] is None:
+            self.save()
+        else:
+            self.discard()
+
+    @property
+    def dirty(self) -> bool:
+        return bool(self.journal)
 
     def instances(self, date: str | None, status: str) -> list[TodoRule]:
-        with_date: list[TodoRule] = []
-        without_date: list[TodoRule] = []
-        for rule in self.data:
-            if date and rule.due_date != parse_date(date):
-                continue
-            if rule.status != status:
-                continue
-
-            if rule.due_date:
-                with_date.append(rule)
-            else:
-                without_date.append(rule)
+        return list(self.iter_instances(date, status))
 
-        with_date.sort(key=lambda rule: (rule.due_date,))
-        if status != "uncompleted":
-            with_date.reverse()
+    def iter_instances(
+        self,
+        date: str | None,
+        status: str,
+        limit: int | None = None,
+        offset: int = 0,
+    ) -> Iterator[TodoRule]:
+        index = self._sort_index()
+        reverse = status != "uncompleted"
+        if date:
+            day = parse_date(date)
+            self._load_archive(status, day, day, dated=True)
+            rules = self._iter_due(status, day, day, reverse)
+        else:
+            self._load_archive(status)
+            rules = itertools.chain(
+                index.iter_undated(status), index.iter_dated(status, reverse=reverse)
+            )
 
-        return without_date + with_date
+        stop = None if limit is None else offset + limit
+        return itertools.islice(rules, offset, stop)
 
-    def index(self, id: int) -> int:
-        for ind, d in enumerate(self.data):
-            if d.id == id:
-                return ind
-        raise KeyError(f"ID not found: {id}")
+    def iter_query(
+        self,
+        expr: str,
+        status: str,
+        limit: int | None = None,
+        offset: int = 0,
+    ) -> Iterator[TodoRule]:
+        # TODOs matching a filter expression (see query.py), in the order of
+        # iter_instances for each status in turn. `status` applies unless the
+        # expression has a status term. Raises ValueError for invalid terms.
+        query = compile_query(expr, status)
+        rules = itertools.chain.from_iterable(
+            self._plan(query, each) for each in query.statuses
+        )
+        stop = None if limit is None else offset + limit
+        return itertools.islice(filter(query.matches, rules), offset, stop)
+
+    def iter_range(
+        self,
+        status: str,
+        start: datetime.date | None,
+        end: datetime.date | None,
+    ) -> Iterator[TodoRule]:
+        # TODOs due between `start` and `end` (both inclusive) by due date,
+        # recurring ones once per occurrence, or only at the next one without
+        # an end
+        self._load_archive(status, start, end, dated=True)
+        return self._iter_due(status, start, end)
+
+    def iter_rules(self) -> Iterator[TodoRule]:
+        # Every TODO, by id, archived ones included
+        self._load_all()
+        self._load_shards(self.store.archive.select())
+        if self.archived:
+            self.data = dict(sorted(self.data.items()))
+        return iter(self.data.values())
 
     def info(self, id: int) -> TodoRule:
-        return self.data[self.index(id)]
+        return self._find(id)
+
+    def search(self, query: str, limit: int | None = None) -> list[TodoRule]:
+        # TODOs matching any word of `query` in their title, group or
+        # comment, best first
+        hits = self._search_index().search(query, limit)
+        rules = []
+        for id, _ in hits:
+            try:
+                rules.append(self._get(id))
+            except KeyError:
+                # left in an index by a bug or a crash
+                logger.warning("ID %d is in the search index but not found", id)
+        return rules
+
+    def groups(self) -> list[Summary]:
+        # Counts of every subtree of groups, see GroupTree
+        # of the TODOs not archived
+        if self.group_tree is None:
+            self._load_all()
+            self.group_tree = GroupTree(self._hot_rules())
+        return self.group_tree.summary(today())
 
-    def save(self) -> None:
-        DATA_PATH.parent.mkdir(parents=True, exist_ok=True)
+    def table(self) -> Table:
+        # Columnar copy of every TODO, for filtering many of them at once
+        from .columnar import Table
+
+        return Table(self.iter_rules())
+
+    def refresh(self) -> None:
+        # Picks up what other processes wrote, keeping the pending mutations
+        with self.store.lock(shared=True):
+            if self.store.version() != self.version:
+                self._rebase()
+
+    def save(self, compact: bool = False) -> None:
+        if not (self.dirty or compact):
+            return
 
-        data_dict: list[dict] = list(map(lambda rule: rule.into_dict(), self.data))
-        with DATA_PATH.open("w") as f:
-            yaml.dump(data_dict, f)
+        with self.store.lock():
+            if self.store.version() != self.version:
+                logger.debug("%s changed since it was loaded", self.store.path)
+                self._rebase()
+
+            if compact or self.journal_size + len(self.journal) >= JOURNAL_LIMIT:
+                self._compact()
+            else:
+                self.store.append(self.journal)
+                self.journal_size += len(self.journal)
+            self._drop_restored()
+            self.journal = []
+            self.version = self.store.version()
+
+    def discard(self) -> None:
+        # Drops the pending mutations, going back to what the store holds
+        if not self.dirty:
+            return
+        self.journal = []
+        with self.store.lock(shared=True):
+            self._load()
+
+    def compact(self) -> None:
+        self.save(compact=True)
+
+    def archive(self, before: datetime.date) -> int:
+        # Moves the finished TODOs due before `before`, and those without a
+        # due date, from the data file to the archive. Series move once they
+        # have ended before `before`. Returns how many moved.
+        with self.store.lock():
+            if self.store.version() != self.version:
+                self._rebase()
+            self._load_all()
+            self.store.archive.read_manifest()
+            moving = [
+                rule
+                for rule in self._hot_rules()
+                if rule.status != "uncompleted"
+                and pending_date(rule) is None
+                and (rule.due_date is None or rule.due_date < before)
+                and (
+                    rule.recurrence is None
+                    or rule.recurrence.until is not None
+                    and rule.recurrence.until < before
+                )
+            ]
+            if not (moving or self.dirty):
+                return 0
+
+            self._drop_restored()
+            # archived first: if the data file is not rewritten, it still wins
+            if moving:
+                self.store.archive.add(moving)
+            for rule in moving:
+                self.archived[rule.id] = shard_name(rule)
+                if self.search_index is not None:
+                    self.search_index.discard(rule.id)
+                if self.group_tree is not None:
+                    self.group_tree.discard(rule)
+            self._compact()
+            self.journal = []
+            self.version = self.store.version()
+        return len(moving)
 
     def append(self, rule: TodoRule) -> int:
         rule.id = self.next_id
-        self.data.append(rule)
-        self.next_id += 1
+        self._insert(rule)
+        self.journal.append({"op": "append", "rule": rule})
         return rule.id
 
+    def extend(self, rules: Iterable[TodoRule]) -> list[int]:
+        return [self.append(rule) for rule in rules]
+
     def update(self, id: int, rule: TodoRule):
         rule.id = id
-        self.data[self.index(id)] = rule
+        old = self._find(id)
+        if rule.overrides is None:
+            rule.inherit_overrides(old)
+        if old.into_dict() == rule.into_dict():
+            return
+        self._restore(old)
+        self._replace(rule)
+        self.journal.append({"op": "update", "rule": rule})
+
+    def mark(self, id: int, status: str, date: datetime.date | None = None):
+        # Marks a single occurrence of a recurring TODO if `date` is given
+        rule = self._find(id)
+        if date is None:
+            current = rule.status
+        else:
+            rule.check_occurrence(date)
+            current = rule.status_on(date)
+        if current == status:
+            return
 
-    def mark(self, id: int, status: str):
-        self.data[self.index(id)].set_status(status)
+        self._restore(rule)
+        self._set_status(id, status, date)
+        op = {"op": "mark", "id": id, "status": status}
+        if date is not None:
+            op["date"] = date.isoformat()
+        self.journal.append(op)
 
     def remove(self, id: int):
-        self.data.pop(self.index(id))
+        self._restore(self._find(id))
+        self._delete(id)
+        self.journal.append({"op": "remove", "id": id})
+
+    def _rebase(self):
+        # Another process wrote to the store since it was loaded. Reload it and
+        # apply the pending mutations on top instead of overwriting its work.
+        pending = self.journal
+        self.journal = []
+        self._load()
+        # new ids of the appended TODOs whose id was taken meanwhile, which
+        # the records after them must follow
+        moved: dict[int, int] = {}
+        for op in pending:
+            op = renumber(op, moved)
+            id = op_id(op)
+            try:
+                self._apply(op)
+            except (KeyError, ValueError) as e:
+                # removed, or rescheduled for a marked occurrence
+                logger.warning(
+                    "dropped %s of a TODO changed meanwhile: %s", op["op"], e
+                )
+            else:
+                if op["op"] == "append" and op_id(op) != id:
+                    moved[id] = op_id(op)
+                self.journal.append(op)
+
+    def _apply(self, op: dict):
+        kind = op["op"]
+        if kind == "append":
+            rule = op["rule"]
+            if self._exists(rule.id):
+                # the other process created a TODO with the same id
+                rule.id = self.next_id
+            self._insert(rule)
+        elif kind == "update":
+            self._replace(op["rule"])
+        elif kind == "restore":
+            rule = op["rule"]
+            if self._exists(rule.id):
+                self._replace(rule)
+            else:
+                self._insert(rule)
+            self.restored.add(rule.id)
+        elif kind == "mark":
+            self._set_status(op["id"], op["status"], decode_date(op.get("date")))
+        elif kind == "remove":
+            self._delete(op["id"])
+
+    def _compact(self):
+        self._load_all()
+        rules = self._hot_rules()
+        self.store.compact(rules)
+        if self.search_index is not None:
+            # otherwise it is rebuilt by the next search
+            self.store.write_index(rules)
+        self.journal_size = 0
+
+    def _hot_rules(self) -> list[TodoRule]:
+        # The TODOs of the data file, by id
+        if not self.archived:
+            return list(self.data.values())
+        return [
+            rule for id, rule in sorted(self.data.items()) if id not in self.archived
+        ]
+
+    def _load_archive(
+        self,
+        status: str,
+        start: datetime.date | None = None,
+        end: datetime.date | None = None,
+        dated: bool | None = None,
+    ):
+        # Loads the shards which may hold TODOs of `status` due between
+        # `start` and `end`. Archived TODOs have no uncompleted occurrence.
+        if status == "uncompleted":
+            return
+        self._load_shards(self.store.archive.select(start, end, dated))
+
+    def _load_shards(self, names: list[str]):
+        # in parallel if they are large, see load_files
+        names = [name for name in names if name not in self.shards]
+        paths = [self.store.archive.shard_path(name) for name in names]
+        for name, rules in zip(names, load_files(paths, self.store.loader)):
+            self.shards.add(name)
+            for rule in rules:
+                other = self.archived.get(rule.id)
+                if other is not None:
+                    # the manifest tells which copy is current
+                    logger.warning(
+                        "ID %d is archived in both %s and %s", rule.id, other, name
+                    )
+                    if self.store.archive.find(rule.id) != name:
+                        continue
+                elif self._exists(rule.id):
+                    # left behind by an interrupted archive or restore
+                    continue
+                if self.sort_index is not None:
+                    if other is not None:
+                        self.sort_index.discard(self.data[rule.id])
+                    self.sort_index.add(rule)
+                self.data[rule.id] = rule
+                self.archived[rule.id] = name
+
+    def _find(self, id: int) -> TodoRule:
+        # Like _get, looking into the archive too
+        try:
+            return self._get(id)
+        except KeyError:
+            name = self.store.archive.find(id)
+            if name is None:
+                raise
+        self._load_shards([name])
+        return self._get(id)
+
+    def _restore(self, rule: TodoRule):
+        # Moves an archived TODO back to the data file before it changes
+        if rule.id not in self.archived:
+            return
+        del self.archived[rule.id]
+        self.restored.add(rule.id)
+        if self.search_index is not None:
+            self.search_index.add(rule)
+        if self.group_tree is not None:
+            self.group_tree.add(rule)
+        self.journal.append({"op": "restore", "rule": rule})
+
+    def _drop_restored(self):
+        # With the store locked, once the restored TODOs are written
+        if self.restored:
+            self.store.archive.read_manifest()
+            self.store.archive.discard(self.restored)
+            self.restored = set()
+
+    def _exists(self, id: int) -> bool:
+        try:
+            self._get(id)
+        except KeyError:
+            return False
+        return True
+
+    def _load_all(self):
+        if self.snapshot is None:
+            return
+
+        for fields in self.snapshot:
+            if fields[0] not in self.taken:
+                self.data[fields[0]] = TodoRule.from_fields(*fields)
+        self.snapshot.close()
+        self.snapshot = None
+        self.taken = set()
+        self.data = dict(sorted(self.data.items()))
+
+    def _sort_index(self) -> SortIndex:
+        if self.sort_index is None:
+            self._load_all()
+            self.sort_index = SortIndex(self.data.values())
+        return self.sort_index
+
+    def _search_index(self) -> SearchIndex:
+        if self.search_index is not None:
+            return self.search_index
+
+        base = self.store.read_index()
+        if base is None and self.store.path.exists():
+            with self.store.lock():
+                # of the data file alone, which it is stamped with, unless
+                # another process wrote since it was loaded
+                snapshot = self.store.read_binary()
+                if snapshot is not None and self.store.version() == self.version:
+                    rules = (TodoRule.from_fields(*fields) for fields in snapshot)
+                    self.store.write_index(rules)
+                    base = self.store.read_index()
+        if base is None:
+            self._load_all()
+            index = SearchIndex()
+            for rule in self._hot_rules():
+                index.add(rule)
+        else:
+            index = SearchIndex(base)
+            changed = self.journal_ids | {op_id(op) for op in self.journal}
+            for id in changed:
+                try:
+                    index.add(self._get(id))
+                except KeyError:
+                    index.discard(id)
+        self.search_index = index
+        return index
+
+    def _iter_due(
+        self,
+        status: str,
+        start: datetime.date | None,
+        end: datetime.date | None,
+        reverse: bool = False,
+    ) -> Iterator[TodoRule]:
+        # Occurrences of recurring TODOs are expanded for the window only, and
+        # merged with the other TODOs by (due date, id). Without an end, series
+        # would never run out, so each one comes once, at its next occurrence.
+        index = self._sort_index()
+        single = index.iter_dated(status, start, end, reverse)
+        if not index.recurring:
+            return single
+
+        single = (rule for rule in single if rule.recurrence is None)
+        series = [
+            itertools.islice(
+                rule.iter_occurrences(status, start, end), None if end else 1
+            )
+            for rule in index.recurring.values()
+        ]
+        if reverse:
+            # only used for bounded windows
+            series = [reversed(list(occurrences)) for occurrences in series]
+        return heapq.merge(
+            single, *series, key=lambda rule: (rule.due_date, rule.id), reverse=reverse
+        )
+
+    def _plan(self, query: Query, status: str) -> Iterator[TodoRule]:
+        # Candidates of the status for the query, narrowed by the smallest
+        # index which applies. The predicates of the query still have to be
+        # checked on them.
+        if query.is_empty():
+            return iter(())
+        self._load_archive(status, query.start, query.end, query.dated)
+        index = self._sort_index()
+        reverse = status != "uncompleted"
+
+        if query.start or query.end:
+            logger.debug("query plan: %s: due date index", query.explain())
+            # open-ended windows by ascending due date, from the next
+            # occurrence of each series
+            return self._iter_due(
+                status, query.start, query.end, reverse and query.end is not None
+            )
+
+        if query.groups:
+            members = index.members(query.groups)
+            if len(members) < index.count(status):
+                logger.debug("query plan: %s: group index", query.explain())
+                candidates = [
+                    rule for rule in members.values() if rule.status == status
+                ]
+                undated = sorted(
+                    (rule for rule in candidates if rule.due_date is None),
+                    key=lambda rule: rule.id,
+                )
+                dated = sorted(
+                    (rule for rule in candidates if rule.due_date is not None),
+                    key=lambda rule: (rule.due_date, rule.id),
+                    reverse=reverse,
+                )
+                return itertools.chain(undated, dated)
+
+        logger.debug("query plan: %s: status index", query.explain())
+        if query.dated:
+            return index.iter_dated(status, reverse=reverse)
+        if query.dated is False:
+            return index.iter_undated(status)
+        return itertools.chain(
+            index.iter_undated(status), index.iter_dated(status, reverse=reverse)
+        )
+
+    def _get(self, id: int) -> TodoRule:
+        rule = self.data.get(id)
+        if rule is not None:
+            return rule
+        if self.snapshot is not None and id not in self.taken:
+            fields = self.snapshot.get(id)
+            if fields is not None:
+                self.taken.add(id)
+                rule = self.data[id] = TodoRule.from_fields(*fields)
+                return rule
+        raise KeyError(f"ID not found: {id}")
+
+    def _insert(self, rule: TodoRule):
+        self.data[rule.id] = rule
+        self.next_id = max(self.next_id, rule.id + 1)
+        if self.sort_index is not None:
+            self.sort_index.add(rule)
+        if self.search_index is not None:
+            self.search_index.add(rule)
+        if self.group_tree is not None:
+            self.group_tree.add(rule)
+
+    def _replace(self, rule: TodoRule):
+        old = self._get(rule.id)
+        if self.sort_index is not None:
+            self.sort_index.discard(old)
+            self.sort_index.add(rule)
+        if self.search_index is not None:
+            self.search_index.add(rule)
+        if self.group_tree is not None:
+            self.group_tree.discard(old)
+            self.group_tree.add(rule)
+        self.data[rule.id] = rule
+
+    def _set_status(self, id: int, status: str, date: datetime.date | None = None):
+        rule = self._get(id)
+        if self.group_tree is not None:
+            # counted again once changed, or as it was on failure
+            self.group_tree.discard(rule)
+        try:
+            if date is not None:
+                # the series stays indexed by its own status
+                rule.set_override(date, status)
+                return
+            old_status = rule.status
+            rule.set_status(status)
+            if self.sort_index is not None:
+                self.sort_index.discard(rule, old_status)
+                self.sort_index.add(rule)
+        finally:
+            if self.group_tree is not None:
+                self.group_tree.add(rule)
+
+    def _delete(self, id: int):
+        rule = self._get(id)
+        del self.data[id]
+        if self.sort_index is not None:
+            self.sort_index.discard(rule)
+        if self.search_index is not None:
+            self.search_index.discard(id)
+        if self.group_tree is not None:
+            self.group_tree.discard(rule)
+
+    def _replay(self, op: dict):
+        # Records may already be folded into the snapshot if a compaction was
+        # interrupted, so every operation must be safe to apply twice.
+        kind = op["op"]
+        if kind in ("append", "update", "restore"):
+            rule = TodoRule.from_record(op["rule"])
+            try:
+                self._replace(rule)
+            except KeyError:
+                self._insert(rule)
+        elif kind == "mark":
+            try:
+                self._set_status(op["id"], op["status"], decode_date(op.get("date")))
+            except (KeyError, ValueError):
+                # ValueError if the series was rescheduled since
+                pass
+        elif kind == "remove":
+            try:
+                self._delete(op["id"])
+            except KeyError:
+                pass
+        else:
+            raise ValueError(f"Unknown journal record: {kind}")
+
+
+def op_id(op: dict) -> int:
+    # id of the TODO a journal record is about
+    rule = op.get("rule")
+    if rule is None:
+        return op["id"]
+    return rule.id if isinstance(rule, TodoRule) else rule["id"]
+
+
+def renumber(op: dict, moved: dict[int, int]) -> dict:
+    # The record with the id of its TODO changed as in `moved`
+    if op["op"] == "append" or op_id(op) not in moved:
+        return op
+    id = moved[op_id(op)]
+    rule = op.get("rule")
+    if rule is None:
+        return op | {"id": id}
+    rule.id = id
+    return op
 
 
 def rule_to_dict(item: tuple[int, TodoRule]) -> dict:
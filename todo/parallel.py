@@ -0,0 +1,104 @@
+from __future__ import annotations
+import logging
+import mmap
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from .rule import TodoRule
+from .snapshot import Snapshot, pack_snapshot
+from .storage import parse_records, read_records
+
+
+# Inputs smaller than this, in total, are parsed in the calling process, as
+# starting workers would cost more than they save
+PARALLEL_MIN_BYTES = 2 << 20
+# Bytes of YAML given to a worker at a time
+CHUNK_BYTES = 256 << 10
+# A new item of the list of TODOs, as written by yaml.dump
+ITEM_START = b"\n- "
+
+logger = logging.getLogger(__name__)
+
+
+def load_files(
+    paths: list[Path], loader: type, workers: int | None = None
+) -> list[list[TodoRule]]:
+    # TODOs of YAML data files, in the order of `paths`. Large inputs are
+    # split by file and by chunk across a pool of `workers` processes, which
+    # send back their TODOs as binary snapshots.
+    sizes = [path.stat().st_size if path.exists() else 0 for path in paths]
+    workers = workers or os.cpu_count() or 1
+    if sum(sizes) < PARALLEL_MIN_BYTES or workers < 2:
+        result = [load_file(path, loader) for path in paths]
+    else:
+        result = load_chunks(paths, sizes, loader, workers)
+    for path, rules in zip(paths, result):
+        check_ids(path, rules)
+    return result
+
+
+def load_file(path: Path, loader: type) -> list[TodoRule]:
+    return [TodoRule.from_record(record) for record in read_records(path, loader)]
+
+
+def load_chunks(
+    paths: list[Path], sizes: list[int], loader: type, workers: int
+) -> list[list[TodoRule]]:
+    tasks = [
+        (path, start, end)
+        for path, size in zip(paths, sizes)
+        if size
+        for start, end in split(path, size)
+    ]
+    logger.debug("parsing %d chunks with %d processes", len(tasks), workers)
+    out: dict[Path, list[TodoRule]] = {path: [] for path in paths}
+    whole: set[Path] = set()
+    with ProcessPoolExecutor(workers) as pool:
+        futures = [pool.submit(parse_chunk, *task, loader) for task in tasks]
+        for (path, _, _), future in zip(tasks, futures):
+            try:
+                blob = future.result()
+            except Exception as e:
+                # A valid file may have invalid chunks, such as aliases to the
+                # anchors of other items. Parsed whole, it tells which it is.
+                logger.debug("parsing %s whole: %s", path, e)
+                whole.add(path)
+                continue
+            out[path].extend(TodoRule.from_fields(*fields) for fields in Snapshot(blob))
+    for path in whole:
+        out[path] = load_file(path, loader)
+    return [out[path] for path in paths]
+
+
+def check_ids(path: Path, rules: list[TodoRule]) -> None:
+    # Of TODOs sharing an id, the managers keep the last one
+    seen: set[int] = set()
+    for rule in rules:
+        if rule.id in seen:
+            logger.warning("ID %d is found more than once in %s", rule.id, path)
+        seen.add(rule.id)
+
+
+def split(path: Path, size: int) -> list[tuple[int, int]]:
+    # (start, end) offsets of chunks of about CHUNK_BYTES, each a list of whole
+    # TODOs. Files not written by yaml.dump may come out as a single chunk.
+    if size <= CHUNK_BYTES:
+        return [(0, size)]
+    bounds = [0]
+    with path.open("rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+        while True:
+            i = m.find(ITEM_START, bounds[-1] + CHUNK_BYTES)
+            if i == -1:
+                break
+            bounds.append(i + 1)
+    bounds.append(size)
+    return list(zip(bounds, bounds[1:]))
+
+
+def parse_chunk(path: Path, start: int, end: int, loader: type) -> bytes:
+    with path.open("rb") as f:
+        f.seek(start)
+        text = f.read(end - start).decode()
+    records = parse_records(text, loader, path)
+    return pack_snapshot(TodoRule.from_record(record) for record in records)
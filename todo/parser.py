@@ -1,5 +1,9 @@
 import datetime
 import re
+from typing import Iterable
+
+from .recurrence import Recurrence
+from .utils import daily_cache
 
 
 WEEKDAYS = [
@@ -11,96 +15,142 @@ WEEKDAYS = [
     "saturday",
     "sunday",
 ]
-
-
-def parse_date(date_str: str) -> datetime.date:
-    if re.match(r"^\d{8}$", date_str):
-        # 20230530
+WEEKDAY_INDEX = {name: i for i, name in enumerate(WEEKDAYS)}
+
+# Every format accepted by parse_date, in order of precedence. The name of the
+# matched group tells which one it is.
+DATE_PATTERN = re.compile(
+    r"""^(?:
+        (?P<basic>\d{8}$)                     # 20230530
+        | (?P<iso>\d{4}-\d{1,2}-\d{1,2}$)     # 2023-05-30 or 2023-5-30
+        | (?P<slash>\d{4}/\d{1,2}/\d{1,2}$)   # 2023/05/30 or 2023/5/30
+        | (?P<short>\d{3,4}$)                 # 0530 or 530
+        | (?P<short_dash>\d{1,2}-\d{1,2})     # 05-30 or 5-30
+        | (?P<short_slash>\d{1,2}/\d{1,2})    # 05/30 or 5/30
+        | (?P<days>\d+\ days?$)               # 3 day(s)
+        | (?P<weeks>\d+\ weeks?$)             # 3 week(s)
+        | (?P<months>\d+\ months?$)           # 3 month(s)
+        | (?P<d>\d+d$)                        # 3d
+        | (?P<w>\d+w$)                        # 3w
+        | (?P<m>\d+m$)                        # 3m
+        | (?P<yesterday>yesterday$)
+        | (?P<today>today$)
+        | (?P<tomorrow>tomorrow$)
+    )""",
+    flags=re.VERBOSE | re.IGNORECASE,
+)
+
+
+@daily_cache()
+def parse_date(date_str: str, today: datetime.date) -> datetime.date:
+    match = DATE_PATTERN.match(date_str)
+    kind = match.lastgroup if match else None
+
+    if kind == "basic":
         return datetime.date.fromisoformat(date_str)
-    elif re.match(r"^\d{4}-\d{1,2}-\d{1,2}$", date_str):
-        # 2023-05-30 or 2023-5-30
+    elif kind == "iso":
         y, m, d = list(map(int, date_str.split("-")))
         return datetime.date(y, m, d)
-    elif re.match(r"^\d{4}/\d{1,2}/\d{1,2}$", date_str):
-        # 2023/05/30 or 2023/5/30
+    elif kind == "slash":
         y, m, d = list(map(int, date_str.split("/")))
         return datetime.date(y, m, d)
 
-    elif re.match(r"^\d{3,4}$", date_str):
-        # 0530 or 530
-        y = datetime.date.today().year
+    elif kind == "short":
+        y = today.year
         m = int(date_str[:-2])
         d = int(date_str[-2:])
         return datetime.date(y, m, d)
-    elif re.match(r"^\d{1,2}-\d{1,2}", date_str):
-        # 05-30 or 5-30
-        y = datetime.date.today().year
+    elif kind == "short_dash":
+        y = today.year
         m, d = list(map(int, date_str.split("-")))
         return datetime.date(y, m, d)
-    elif re.match(r"^\d{1,2}/\d{1,2}", date_str):
-        # 05/30 or 5/30
-        y = datetime.date.today().year
+    elif kind == "short_slash":
+        y = today.year
         m, d = list(map(int, date_str.split("/")))
         return datetime.date(y, m, d)
 
-    elif re.match(r"^\d+ days?$", date_str, flags=re.IGNORECASE):
-        # 3 day(s)
-        today = datetime.date.today()
-        days = int(date_str.split()[0])
-        return today + datetime.timedelta(days)
-    elif re.match(r"^\d+ weeks?$", date_str, flags=re.IGNORECASE):
-        # 3 week(s)
-        today = datetime.date.today()
-        weeks = int(date_str.split()[0])
-        return today + datetime.timedelta(days=weeks * 7)
-    elif re.match(r"^\d+ months?$", date_str, flags=re.IGNORECASE):
-        # 3 month(s)
-        today = datetime.date.today()
-        months = int(date_str.split()[0])
-        y = today.year + (today.month + months - 1) // 12
-        m = (today.month + months - 1) % 12 + 1
-        d = today.day
-        return datetime.date(y, m, d)
+    elif kind in ("days", "weeks", "months"):
+        return shift(today, int(date_str.split()[0]), kind[0])
+    elif kind in ("d", "w", "m"):
+        return shift(today, int(date_str[:-1]), kind)
 
-    elif re.match(r"^\d+d$", date_str, flags=re.IGNORECASE):
-        # 3d
-        today = datetime.date.today()
-        days = int(date_str[:-1])
-        return today + datetime.timedelta(days)
-    elif re.match(r"^\d+w$", date_str, flags=re.IGNORECASE):
-        # 3w
-        today = datetime.date.today()
-        weeks = int(date_str[:-1])
-        return today + datetime.timedelta(days=weeks * 7)
-    elif re.match(r"^\d+m$", date_str, flags=re.IGNORECASE):
-        # 3m
-        today = datetime.date.today()
-        months = int(date_str[:-1])
-        y = today.year + (today.month + months - 1) // 12
-        m = (today.month + months - 1) % 12 + 1
-        d = today.day
-        return datetime.date(y, m, d)
+    elif kind == "yesterday":
+        return today - datetime.timedelta(days=1)
+    elif kind == "today":
+        return today
+    elif kind == "tomorrow":
+        return today + datetime.timedelta(days=1)
 
-    elif re.match(r"^yesterday$", date_str, flags=re.IGNORECASE):
-        # yesterday
-        return datetime.date.today() - datetime.timedelta(days=1)
-    elif re.match(r"^today$", date_str, flags=re.IGNORECASE):
-        # today
-        return datetime.date.today()
-    elif re.match(r"^tomorrow$", date_str, flags=re.IGNORECASE):
-        # tomorrow
-        return datetime.date.today() + datetime.timedelta(days=1)
-
-    elif date_str.lower() in WEEKDAYS:
+    elif date_str.lower() in WEEKDAY_INDEX:
         # monday
-        today = datetime.date.today()
-        i = WEEKDAYS.index(date_str.lower())
+        i = WEEKDAY_INDEX[date_str.lower()]
         diff = (7 + i - today.weekday()) % 7
         return today + datetime.timedelta(days=diff)
 
     raise ValueError(f'"{date_str}" is not a valid format for date.')
 
 
+def shift(date: datetime.date, n: int, unit: str) -> datetime.date:
+    if unit == "d":
+        return date + datetime.timedelta(n)
+    elif unit == "w":
+        return date + datetime.timedelta(days=n * 7)
+    y = date.year + (date.month + n - 1) // 12
+    m = (date.month + n - 1) % 12 + 1
+    return datetime.date(y, m, date.day)
+
+
+# Recurrence written after the due date: "monday every 2 weeks until 12-31"
+RECURRENCE_PATTERN = re.compile(
+    r"""^(?:(?P<date>.+?)\s+)?(?:
+        (?P<adverb>daily|weekly|monthly|yearly)
+        | every(?:\s+(?P<interval>\d+))?\s+(?P<unit>day|week|month|year)s?
+    )(?:\s+until\s+(?P<until>.+))?$""",
+    flags=re.VERBOSE | re.IGNORECASE,
+)
+ADVERBS = {"daily": "day", "weekly": "week", "monthly": "month", "yearly": "year"}
+
+
+def parse_due(text: str) -> tuple[str, Recurrence | None]:
+    # Splits a due date field into the date and the recurrence, if any
+    match = RECURRENCE_PATTERN.match(text.strip())
+    if not match:
+        return text, None
+
+    if match["adverb"]:
+        recurrence = Recurrence(1, ADVERBS[match["adverb"].lower()])
+    else:
+        recurrence = Recurrence(int(match["interval"] or 1), match["unit"].lower())
+    if match["until"]:
+        recurrence.until = parse_date(match["until"])
+    return match["date"] or "", recurrence
+
+
+def parse_recurrence(text: str) -> Recurrence:
+    date, recurrence = parse_due(text)
+    if recurrence is None or date:
+        raise ValueError(f'"{text}" is not a valid recurrence.')
+    return recurrence
+
+
+ID_PATTERN = re.compile(r"(\d+)(?:-(\d+))?")
+
+
+def parse_ids(args: Iterable[str]) -> list[int]:
+    # 3 or 3-7, without duplicates
+    ids: dict[int, None] = {}
+    for arg in args:
+        match = ID_PATTERN.fullmatch(arg)
+        if not match:
+            raise ValueError(f'"{arg}" is not a valid ID or range of IDs.')
+        first = int(match[1])
+        last = int(match[2]) if match[2] else first
+        if first > last:
+            raise ValueError(f'"{arg}" is an empty range of IDs.')
+        ids.update(dict.fromkeys(range(first, last + 1)))
+    return list(ids)
+
+
 def parse_editor(text: str) -> tuple[str, str, str, str]:
     title = ""
     group = ""
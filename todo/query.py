@@ -0,0 +1,172 @@
+from __future__ import annotations
+import datetime
+import re
+from typing import Callable
+
+from .parser import parse_date
+from .rule import STATUSES, TodoRule
+from .utils import today
+
+
+# Terms of a filter expression, all of which must match. Prefixed with "-",
+# a term must not match instead.
+#
+#   status:completed,not-planed   any of the statuses
+#   due:2023-05-30 due:<2w        due on the date, before 2 weeks from today
+#   due:2024-01..2024-03          from January to March, either side optional
+#   due:none due:any              without or with a due date
+#   group:work group:work*        in the group, in groups beginning with work
+#   is:overdue                    due before today
+#   report                        with "report" in the title or comment
+TERM_PATTERN = re.compile(
+    r"(?P<negated>-)?(?:(?P<key>[a-z]+):(?P<value>\S+)|(?P<word>\S+))"
+)
+RANGE_PATTERN = re.compile(r"(?P<op><=|>=|<|>)?(?P<value>.*)")
+MONTH_PATTERN = re.compile(r"(\d{4})-(\d{1,2})")
+
+Predicate = Callable[[TodoRule], bool]
+
+
+class Query:
+    # Filter expression compiled once: dates are resolved and every term is
+    # turned into a predicate. The bounds kept in the other attributes let
+    # managers pick an index before checking the predicates.
+    statuses: list[str]
+    start: datetime.date | None  # both inclusive
+    end: datetime.date | None
+    dated: bool | None  # whether TODOs must have a due date, if it matters
+    groups: list[str]  # any of these groups or, ending with *, prefixes
+    predicates: list[Predicate]
+
+    def __init__(self, default_status: str = "uncompleted") -> None:
+        self.statuses = [default_status]
+        self.start = None
+        self.end = None
+        self.dated = None
+        self.groups = []
+        self.predicates = []
+
+    def matches(self, rule: TodoRule) -> bool:
+        return all(predicate(rule) for predicate in self.predicates)
+
+    def is_empty(self) -> bool:
+        # whether nothing can match the due date bounds
+        return (
+            self.dated is False
+            and bool(self.start or self.end)
+            or bool(self.start and self.end and self.start > self.end)
+        )
+
+    def explain(self) -> str:
+        out = f"status in {self.statuses}"
+        if self.start or self.end:
+            out += f", due from {self.start or '-'} to {self.end or '-'}"
+        elif self.dated is not None:
+            out += ", with due date" if self.dated else ", without due date"
+        if self.groups:
+            out += f", group in {self.groups}"
+        return out + f", {len(self.predicates)} predicates"
+
+
+def compile_query(text: str, default_status: str = "uncompleted") -> Query:
+    # Raises ValueError for invalid terms
+    query = Query(default_status)
+    for match in TERM_PATTERN.finditer(text):
+        if match["negated"]:
+            # checked by predicate only
+            inner = Query(default_status)
+            add_term(inner, match)
+            query.predicates.append(negate(inner))
+        else:
+            add_term(query, match)
+    return query
+
+
+def add_term(query: Query, match: re.Match) -> None:
+    key = match["key"]
+    value = match["value"]
+    if match["word"] is not None:
+        word = match["word"].lower()
+        query.predicates.append(
+            lambda rule: word in rule.title.lower() or word in rule.comment.lower()
+        )
+    elif key == "status":
+        statuses = value.split(",")
+        for status in statuses:
+            if status not in STATUSES:
+                raise ValueError(f"Unknown status: {status}")
+        query.statuses = statuses
+        query.predicates.append(lambda rule: rule.status in statuses)
+    elif key == "due":
+        add_due(query, value)
+    elif key == "group":
+        query.groups = [value]
+        if value.endswith("*"):
+            prefix = value[:-1]
+            query.predicates.append(lambda rule: rule.group.startswith(prefix))
+        else:
+            query.predicates.append(lambda rule: rule.group == value)
+    elif key == "is" and value == "overdue":
+        add_due(query, f"<{today().isoformat()}")
+    else:
+        raise ValueError(f"Unknown filter: {match[0]}")
+
+
+def add_due(query: Query, value: str) -> None:
+    if value in ("none", "any"):
+        dated = query.dated = value == "any"
+        query.predicates.append(lambda rule: (rule.due_date is not None) == dated)
+        return
+
+    if ".." in value:
+        low, high = value.split("..", 1)
+        start = first_day(low) if low else None
+        end = last_day(high) if high else None
+    else:
+        match = RANGE_PATTERN.fullmatch(value)
+        assert match
+        op, literal = match["op"], match["value"]
+        start = end = None
+        if op == "<":
+            end = first_day(literal) - datetime.timedelta(days=1)
+        elif op == "<=":
+            end = last_day(literal)
+        elif op == ">":
+            start = last_day(literal) + datetime.timedelta(days=1)
+        elif op == ">=":
+            start = first_day(literal)
+        else:
+            start, end = first_day(literal), last_day(literal)
+
+    # several due terms narrow each other
+    if start and (query.start is None or start > query.start):
+        query.start = start
+    if end and (query.end is None or end < query.end):
+        query.end = end
+    query.dated = True
+    query.predicates.append(
+        lambda rule: rule.due_date is not None
+        and (start is None or start <= rule.due_date)
+        and (end is None or rule.due_date <= end)
+    )
+
+
+def first_day(literal: str) -> datetime.date:
+    # 2024-01 stands for the whole month
+    match = MONTH_PATTERN.fullmatch(literal)
+    if match:
+        return datetime.date(int(match[1]), int(match[2]), 1)
+    return parse_date(literal)
+
+
+def last_day(literal: str) -> datetime.date:
+    match = MONTH_PATTERN.fullmatch(literal)
+    if match:
+        year, month = int(match[1]), int(match[2])
+        following = datetime.date(year + month // 12, month % 12 + 1, 1)
+        return following - datetime.timedelta(days=1)
+    return parse_date(literal)
+
+
+def negate(query: Query) -> Predicate:
+    return lambda rule: not query.matches(rule)
@@ -0,0 +1,86 @@
+from __future__ import annotations
+import calendar
+import datetime
+import itertools
+from typing import Iterator
+
+
+UNITS = ["day", "week", "month", "year"]
+
+
+class Recurrence:
+    # Repeats a TODO every `interval` units from its due date, up to `until`
+    # (inclusive) if given. Monthly and yearly series keep the day of month
+    # of the first occurrence, or the last day of shorter months.
+    __slots__ = ("interval", "unit", "until")
+
+    interval: int
+    unit: str
+    until: datetime.date | None
+
+    def __init__(
+        self, interval: int, unit: str, until: datetime.date | None = None
+    ) -> None:
+        if interval < 1:
+            raise ValueError(f"Invalid interval of recurrence: {interval}")
+        if unit not in UNITS:
+            raise ValueError(f"Unknown unit of recurrence: {unit}")
+        self.interval = interval
+        self.unit = unit
+        self.until = until
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, Recurrence) and self.fmt() == other.fmt()
+
+    def __hash__(self) -> int:
+        return hash(self.fmt())
+
+    def fmt(self) -> str:
+        out = f"every {self.interval} {self.unit}"
+        if self.until:
+            out += f" until {self.until.isoformat()}"
+        return out
+
+    def occurrences(
+        self,
+        start: datetime.date,
+        first: datetime.date | None = None,
+        last: datetime.date | None = None,
+    ) -> Iterator[datetime.date]:
+        # Occurrences of a series beginning on `start`, between `first` and
+        # `last` (both inclusive), in order. Computed as they are consumed, so
+        # unbounded series are fine as long as the caller stops.
+        if self.until and (last is None or self.until < last):
+            last = self.until
+        k = self._index(start, first) if first and first > start else 0
+        for k in itertools.count(k):
+            day = self._nth(start, k)
+            if last and day > last:
+                return
+            yield day
+
+    def includes(self, start: datetime.date, day: datetime.date) -> bool:
+        return next(self.occurrences(start, day, day), None) == day
+
+    def _nth(self, start: datetime.date, k: int) -> datetime.date:
+        if self.unit == "day":
+            return start + datetime.timedelta(days=k * self.interval)
+        if self.unit == "week":
+            return start + datetime.timedelta(weeks=k * self.interval)
+        months = k * self.interval * (12 if self.unit == "year" else 1)
+        y, m = divmod(start.month - 1 + months, 12)
+        year = start.year + y
+        day = min(start.day, calendar.monthrange(year, m + 1)[1])
+        return datetime.date(year, m + 1, day)
+
+    def _index(self, start: datetime.date, first: datetime.date) -> int:
+        # Index of the first occurrence on or after `first`
+        if self.unit in ("day", "week"):
+            step = self.interval * (7 if self.unit == "week" else 1)
+            k = -(-(first - start).days // step)
+        else:
+            months = (first.year - start.year) * 12 + first.month - start.month
+            k = months // (self.interval * (12 if self.unit == "year" else 1))
+        while self._nth(start, k) < first:
+            k += 1
+        return k
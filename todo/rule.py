@@ -1,17 +1,49 @@
 from __future__ import annotations
 import datetime
+import sys
+from enum import StrEnum
+from typing import Iterator
 
-from .parser import parse_date
-from .utils import date_to_relative
+from .parser import parse_date, parse_due, parse_recurrence
+from .recurrence import Recurrence
+from .utils import date_to_relative, today
+
+
+class Status(StrEnum):
+    COMPLETED = "completed"
+    UNCOMPLETED = "uncompleted"
+    NOT_PLANED = "not-planed"
+
+
+STATUSES = [status.value for status in Status]
+
+# Shared instances of the due dates, which many TODOs have in common
+DATES: dict[datetime.date, datetime.date] = {}
 
 
 class TodoRule:
+    # Millions of rules may be loaded at once, so they have no __dict__, and
+    # the values repeated across them (status, group, due date) are shared.
+    __slots__ = (
+        "id",
+        "title",
+        "group",
+        "due_date",
+        "comment",
+        "status",
+        "recurrence",
+        "overrides",
+    )
+
     id: int  # 0 means this rule is not registered to Manager
     title: str
     group: str
-    due_date: datetime.date | None
+    due_date: datetime.date | None  # first occurrence if recurring
     comment: str
-    status: str
+    status: Status  # of every occurrence not in `overrides`
+    recurrence: Recurrence | None
+    # Status of the occurrences which differ from the series, None if none do
+    overrides: dict[datetime.date, Status] | None
 
     def __init__(
         self,
@@ -22,22 +54,176 @@ class TodoRule:
         id: int = 0,
         status: str = "uncompleted",
     ) -> None:
+        # "monday every week" starts a series on monday, "daily" today
+        due_date, self.recurrence = parse_due(due_date)
+        if self.recurrence and due_date == "":
+            due_date = today().isoformat()
+
         self.id = id
         self.title = title
-        self.group = group
-        self.due_date = parse_date(due_date) if due_date != "" else None
+        self.group = sys.intern(group)
+        self.due_date = intern_date(parse_date(due_date)) if due_date != "" else None
         self.comment = comment
-        self.status = status
+        self.status = Status(status)
+        self.overrides = None
+
+    @classmethod
+    def from_record(cls, record: dict) -> TodoRule:
+        # Stored records hold the canonical ISO form, which doesn't need to go
+        # through the user-facing grammar of parse_date.
+        recurrence = record.get("recurrence")
+        overrides = record.get("overrides")
+        return cls.from_fields(
+            record["id"],
+            record["title"],
+            record["group"],
+            decode_date(record["due_date"]),
+            record["comment"],
+            record.get("status", "uncompleted"),
+            parse_recurrence(recurrence) if recurrence else None,
+            (
+                {decode_date(day): Status(s) for day, s in overrides.items()}
+                if overrides
+                else None
+            ),
+        )
+
+    @classmethod
+    def from_fields(
+        cls,
+        id: int,
+        title: str,
+        group: str,
+        due_date: datetime.date | None,
+        comment: str,
+        status: str,
+        recurrence: Recurrence | None = None,
+        overrides: dict[datetime.date, Status] | None = None,
+    ) -> TodoRule:
+        rule = cls.__new__(cls)
+        rule.id = id
+        rule.title = title
+        rule.group = sys.intern(group)
+        rule.due_date = intern_date(due_date) if due_date else None
+        rule.comment = comment
+        rule.status = Status(status)
+        rule.recurrence = recurrence
+        rule.overrides = overrides or None
+        return rule
 
     def into_dict(self) -> dict:
-        return {
+        record = {
             "id": self.id,
             "title": self.title,
             "group": self.group,
             "due_date": self.due_date.isoformat() if self.due_date else "",
             "comment": self.comment,
-            "status": self.status,
+            "status": self.status.value,
         }
+        # only recurring TODOs have these fields
+        if self.recurrence:
+            record["recurrence"] = self.recurrence.fmt()
+        if self.overrides:
+            record["overrides"] = {
+                day.isoformat(): status.value
+                for day, status in sorted(self.overrides.items())
+            }
+        return record
+
+    def occurrences(
+        self, first: datetime.date | None = None, last: datetime.date | None = None
+    ) -> Iterator[datetime.date]:
+        # Due dates between `first` and `last` (both inclusive), in order
+        if self.due_date is None:
+            return iter(())
+        if self.recurrence is None:
+            inside = (first is None or first <= self.due_date) and (
+                last is None or self.due_date <= last
+            )
+            return iter((self.due_date,) if inside else ())
+        return self.recurrence.occurrences(self.due_date, first, last)
+
+    def occurrence(self, day: datetime.date) -> TodoRule:
+        # The TODO as due on `day`, with the status of that occurrence
+        return TodoRule.from_fields(
+            self.id,
+            self.title,
+            self.group,
+            day,
+            self.comment,
+            self.status_on(day),
+            self.recurrence,
+        )
+
+    def iter_occurrences(
+        self,
+        status: str,
+        first: datetime.date | None = None,
+        last: datetime.date | None = None,
+    ) -> Iterator[TodoRule]:
+        # Occurrences with `status` between `first` and `last`, in order. Only
+        # overridden ones can differ from the series, so they are looked up
+        # directly instead of walking the series.
+        if status == self.status:
+            days = (
+                day
+                for day in self.occurrences(first, last)
+                if self.status_on(day) == status
+            )
+        else:
+            days = iter(
+                sorted(
+                    day
+                    for day, override in (self.overrides or {}).items()
+                    if override == status
+                    and (first is None or first <= day)
+                    and (last is None or day <= last)
+                )
+            )
+        return map(self.occurrence, days)
+
+    def check_occurrence(self, day: datetime.date) -> None:
+        if not (self.recurrence and self.due_date):
+            raise ValueError(f"#{self.id} is not scheduled.")
+        if not self.recurrence.includes(self.due_date, day):
+            raise ValueError(f"#{self.id} is not scheduled on {day.isoformat()}.")
+
+    def status_on(self, day: datetime.date) -> Status:
+        if self.overrides:
+            return self.overrides.get(day, self.status)
+        return self.status
+
+    def set_override(self, day: datetime.date, status: str) -> None:
+        # Sets the status of a single occurrence
+        if status not in STATUSES:
+            raise ValueError(f"Unknown status: {status}")
+        self.check_occurrence(day)
+
+        overrides = self.overrides or {}
+        if status == self.status:
+            overrides.pop(day, None)
+        else:
+            overrides[intern_date(day)] = Status(status)
+        self.overrides = overrides or None
+
+    def inherit_overrides(self, other: TodoRule) -> None:
+        # Keeps the overrides of `other` which still apply to this series
+        if not (other.overrides and self.recurrence and self.due_date):
+            return
+        overrides = {
+            day: status
+            for day, status in other.overrides.items()
+            if status != self.status and self.recurrence.includes(self.due_date, day)
+        }
+        self.overrides = overrides or None
+
+    def due_text(self) -> str:
+        # Due date field as the user types it, which TodoRule() accepts back
+        if self.due_date is None:
+            return ""
+        if self.recurrence is None:
+            return self.due_date.isoformat()
+        return f"{self.due_date.isoformat()} {self.recurrence.fmt()}"
 
     def fmt_full(self) -> str:
         return self.fmt_editor()
@@ -46,8 +232,17 @@ class TodoRule:
         out = self.title + "\n"
         if self.group:
             out += "# {}\n".format(self.group)
-        if self.due_date:
-            out += "? {}\n".format(date_to_relative(self.due_date))
+        if self.due_date and self.recurrence:
+            # the first occurrence is often past, where relative dates would
+            # be read back as the coming weekday
+            out += "? {}\n".format(self.due_text())
+        elif self.due_date:
+            # relative unless it would be read back as another date, like the
+            # weekday of a date gone by
+            relative = date_to_relative(self.due_date)
+            if parse_date(relative) != self.due_date:
+                relative = self.due_date.isoformat()
+            out += "? {}\n".format(relative)
         if self.comment:
             out += "\n"
             out += self.comment + "\n"
@@ -62,6 +257,26 @@ class TodoRule:
         )
 
     def set_status(self, status) -> None:
-        if status not in ["completed", "uncompleted", "not-planed"]:
+        if status not in STATUSES:
             raise ValueError(f"Unknown status: {status}")
-        self.status = status
+        self.status = Status(status)
+        if self.overrides:
+            # occurrences now agreeing with the series
+            overrides = {d: s for d, s in self.overrides.items() if s != status}
+            self.overrides = overrides or None
+
+
+def intern_date(date: datetime.date) -> datetime.date:
+    return DATES.setdefault(date, date)
+
+
+def decode_date(value: str | datetime.date | None) -> datetime.date | None:
+    if isinstance(value, datetime.date):
+        return value
+    if not value:
+        return None
+    try:
+        return datetime.date.fromisoformat(value)
+    except ValueError:
+        # edited by hand
+        return parse_date(value)
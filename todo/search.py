@@ -0,0 +1,225 @@
+from __future__ import annotations
+import bisect
+import heapq
+import math
+import mmap
+import re
+import struct
+from array import array
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Iterable
+
+from .rule import TodoRule
+from .utils import atomic_write, file_stamp
+
+
+# Layout of a persisted index, little-endian unless noted:
+#
+#   header    magic, version, inode, size and mtime of the YAML file it was
+#             built along, number of documents, number of terms, sum of
+#             lengths
+#   terms     (offset of the term, its length, offset of its postings, number
+#             of postings) for every term, sorted by term
+#   strings   UTF-8 terms
+#   postings  for each term, the ids (uint32), term frequencies (uint16) and
+#             document lengths (uint16) of the documents holding it, in native
+#             byte order
+MAGIC = b"TIDX"
+VERSION = 2
+HEADER = struct.Struct("<4sHxxQQQIIQ")
+TERM = struct.Struct("<IHxxQI")
+
+TOKEN_PATTERN = re.compile(r"\w+")
+# Titles count this many times, so that they rank above comments
+TITLE_WEIGHT = 2
+# Okapi BM25 parameters
+K1 = 1.2
+B = 0.75
+
+MAX_COUNT = 0xFFFF
+
+
+def tokenize(text: str) -> list[str]:
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+def document(rule: TodoRule) -> Counter[str]:
+    terms = Counter(tokenize(rule.group) + tokenize(rule.comment))
+    for term in tokenize(rule.title):
+        terms[term] += TITLE_WEIGHT
+    return terms
+
+
+class IndexFile:
+    # Persisted index, whose postings are only read for the queried terms
+    buf: bytes | mmap.mmap
+    docs: int
+    terms: int
+    total_length: int
+
+    def __init__(self, buf: bytes | mmap.mmap) -> None:
+        self.buf = buf
+        *_, self.docs, self.terms, self.total_length = HEADER.unpack_from(buf)
+
+    def postings(self, term: str) -> tuple[array, array, array]:
+        # ids, term frequencies and document lengths
+        key = term.encode()
+        i = bisect.bisect_left(range(self.terms), key, key=self._term)
+        if i == self.terms or self._term(i) != key:
+            return array("I"), array("H"), array("H")
+
+        _, _, offset, count = TERM.unpack_from(self.buf, HEADER.size + i * TERM.size)
+        ids = array("I", self.buf[offset : offset + 4 * count])
+        offset += 4 * count
+        tfs = array("H", self.buf[offset : offset + 2 * count])
+        offset += 2 * count
+        lengths = array("H", self.buf[offset : offset + 2 * count])
+        return ids, tfs, lengths
+
+    def close(self) -> None:
+        if isinstance(self.buf, mmap.mmap):
+            self.buf.close()
+
+    def _term(self, i: int) -> bytes:
+        offset, length, _, _ = TERM.unpack_from(self.buf, HEADER.size + i * TERM.size)
+        return self.buf[offset : offset + length]
+
+
+class SearchIndex:
+    # Inverted index over titles, groups and comments. The persisted `base`
+    # is kept as is; TODOs changed since are indexed in memory instead, and
+    # their entries in `base` are ignored.
+    base: IndexFile | None
+    changed: set[int]  # ids whose entries in `base` are outdated
+    postings: defaultdict[str, dict[int, int]]  # term -> id -> frequency
+    documents: dict[int, Counter[str]]  # indexed in memory
+    lengths: dict[int, int]
+
+    def __init__(self, base: IndexFile | None = None) -> None:
+        self.base = base
+        self.changed = set()
+        self.postings = defaultdict(dict)
+        self.documents = {}
+        self.lengths = {}
+
+    def add(self, rule: TodoRule):
+        self.discard(rule.id)
+        terms = self.documents[rule.id] = document(rule)
+        for term, count in terms.items():
+            self.postings[term][rule.id] = count
+        self.lengths[rule.id] = sum(terms.values())
+
+    def discard(self, id: int):
+        self.changed.add(id)
+        terms = self.documents.pop(id, None)
+        if terms is None:
+            return
+        del self.lengths[id]
+        for term in terms:
+            postings = self.postings[term]
+            del postings[id]
+            if not postings:
+                del self.postings[term]
+
+    def search(self, query: str, limit: int | None = None) -> list[tuple[int, float]]:
+        # (id, score) of the documents holding any of the terms, best first
+        docs = len(self.lengths)
+        total_length = sum(self.lengths.values())
+        if self.base is not None:
+            # changed documents are still counted in `base`, close enough
+            docs += self.base.docs
+            total_length += self.base.total_length
+        if docs == 0:
+            return []
+        average = total_length / docs
+
+        scores: defaultdict[int, float] = defaultdict(float)
+        for term in set(tokenize(query)):
+            hits = [
+                (id, count, self.lengths[id])
+                for id, count in self.postings.get(term, {}).items()
+            ]
+            if self.base is not None:
+                ids, counts, lengths = self.base.postings(term)
+                hits += (
+                    hit
+                    for hit in zip(ids, counts, lengths)
+                    if hit[0] not in self.changed
+                )
+            if not hits:
+                continue
+
+            idf = math.log(1 + (docs - len(hits) + 0.5) / (len(hits) + 0.5))
+            for id, count, length in hits:
+                norm = K1 * (1 - B + B * length / average)
+                scores[id] += idf * count * (K1 + 1) / (count + norm)
+
+        # ties by id
+        ranked = ((score, -id) for id, score in scores.items())
+        best = heapq.nlargest(limit, ranked) if limit else sorted(ranked, reverse=True)
+        return [(-id, score) for score, id in best]
+
+    def close(self):
+        if self.base is not None:
+            self.base.close()
+
+
+def read_index(path: Path, source: Path) -> IndexFile | None:
+    # Returns None unless `path` exists and was built along the current
+    # `source`, like read_snapshot
+    try:
+        f = path.open("rb")
+    except FileNotFoundError:
+        return None
+
+    with f:
+        header = f.read(HEADER.size)
+        if len(header) < HEADER.size:
+            return None
+        magic, version, *stamp, _, _, _ = HEADER.unpack(header)
+        try:
+            current = file_stamp(source)
+        except FileNotFoundError:
+            return None
+        if (magic, version, tuple(stamp)) != (MAGIC, VERSION, current):
+            return None
+        return IndexFile(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+
+def write_index(path: Path, source: Path, rules: Iterable[TodoRule]) -> None:
+    postings: defaultdict[str, list[tuple[int, int, int]]] = defaultdict(list)
+    docs = 0
+    total_length = 0
+    for rule in rules:
+        terms = document(rule)
+        length = min(sum(terms.values()), MAX_COUNT)
+        for term, count in terms.items():
+            postings[term].append((rule.id, min(count, MAX_COUNT), length))
+        docs += 1
+        total_length += length
+
+    terms = sorted(postings, key=str.encode)
+    strings = [term.encode() for term in terms]
+    offset = HEADER.size + len(terms) * TERM.size
+    string_offsets = []
+    for string in strings:
+        string_offsets.append(offset)
+        offset += len(string)
+
+    entries = []
+    blocks = []
+    for term, string, string_offset in zip(terms, strings, string_offsets):
+        ids, counts, lengths = zip(*postings[term])
+        block = array("I", ids).tobytes()
+        block += array("H", counts).tobytes() + array("H", lengths).tobytes()
+        entries.append(TERM.pack(string_offset, len(string), offset, len(ids)))
+        blocks.append(block)
+        offset += len(block)
+
+    header = HEADER.pack(
+        MAGIC, VERSION, *file_stamp(source), docs, len(terms), total_length
+    )
+    atomic_write(
+        path, header + b"".join(entries) + b"".join(strings) + b"".join(blocks)
+    )
@@ -0,0 +1,177 @@
+import bisect
+import datetime
+import json
+import mmap
+import struct
+from pathlib import Path
+from typing import Iterable, Iterator
+
+from .parser import parse_recurrence
+from .recurrence import Recurrence
+from .rule import Status, TodoRule
+from .utils import atomic_write, file_stamp
+
+
+# Layout of a binary snapshot, all little-endian:
+#
+#   header   magic, version, inode, size and mtime of the YAML file it
+#            mirrors, count
+#   ids      (id, offset of the record) for every record, sorted by id
+#   records  id, due date as an ordinal (0 if none), status code, lengths of
+#            title, group, comment, recurrence and overrides (as JSON),
+#            followed by those five UTF-8 strings, the last two empty unless
+#            the TODO is recurring
+MAGIC = b"TODO"
+VERSION = 3
+HEADER = struct.Struct("<4sHxxQQQI")
+ID_ENTRY = struct.Struct("<IQ")
+RECORD = struct.Struct("<IiBIIIII")
+
+STATUS_LIST = list(Status)
+STATUS_CODES = {status: i for i, status in enumerate(STATUS_LIST)}
+
+Fields = tuple[
+    int,
+    str,
+    str,
+    datetime.date | None,
+    str,
+    Status,
+    Recurrence | None,
+    dict[datetime.date, Status] | None,
+]
+
+
+class Snapshot:
+    buf: bytes | mmap.mmap
+    count: int
+
+    def __init__(self, buf: bytes | mmap.mmap) -> None:
+        self.buf = buf
+        *_, self.count = HEADER.unpack_from(buf)
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __iter__(self) -> Iterator[Fields]:
+        pos = HEADER.size + self.count * ID_ENTRY.size
+        for _ in range(self.count):
+            fields, pos = self._read(pos)
+            yield fields
+
+    def max_id(self) -> int:
+        return self._id_entry(self.count - 1)[0] if self.count else 0
+
+    def get(self, id: int) -> Fields | None:
+        i = bisect.bisect_left(
+            range(self.count), id, key=lambda i: self._id_entry(i)[0]
+        )
+        if i == self.count:
+            return None
+        found, offset = self._id_entry(i)
+        if found != id:
+            return None
+        return self._read(offset)[0]
+
+    def close(self) -> None:
+        if isinstance(self.buf, mmap.mmap):
+            self.buf.close()
+
+    def _id_entry(self, i: int) -> tuple[int, int]:
+        return ID_ENTRY.unpack_from(self.buf, HEADER.size + i * ID_ENTRY.size)
+
+    def _read(self, pos: int) -> tuple[Fields, int]:
+        id, ordinal, status, *lengths = RECORD.unpack_from(self.buf, pos)
+        pos += RECORD.size
+        strings = []
+        for length in lengths:
+            strings.append(str(self.buf[pos : pos + length], "utf-8"))
+            pos += length
+        title, group, comment, recurrence, overrides = strings
+
+        due_date = datetime.date.fromordinal(ordinal) if ordinal else None
+        fields = (
+            id,
+            title,
+            group,
+            due_date,
+            comment,
+            STATUS_LIST[status],
+            parse_recurrence(recurrence) if recurrence else None,
+            decode_overrides(overrides) if overrides else None,
+        )
+        return fields, pos
+
+
+def read_snapshot(path: Path, source: Path, mapped: bool = False) -> Snapshot | None:
+    # Returns None unless `path` exists and mirrors the current `source`. A
+    # mapped snapshot only reads the records which are asked for.
+    try:
+        f = path.open("rb")
+    except FileNotFoundError:
+        return None
+
+    with f:
+        header = f.read(HEADER.size)
+        if len(header) < HEADER.size:
+            return None
+        magic, version, *stamp, _ = HEADER.unpack(header)
+        try:
+            current = file_stamp(source)
+        except FileNotFoundError:
+            return None
+        if (magic, version, tuple(stamp)) != (MAGIC, VERSION, current):
+            return None
+
+        f.seek(0)
+        if mapped:
+            return Snapshot(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+        return Snapshot(f.read())
+
+
+def write_snapshot(path: Path, source: Path, rules: Iterable[TodoRule]) -> None:
+    atomic_write(path, pack_snapshot(rules, file_stamp(source)))
+
+
+def pack_snapshot(
+    rules: Iterable[TodoRule], stamp: tuple[int, int, int] = (0, 0, 0)
+) -> bytes:
+    # A snapshot in memory, stamped with the file_stamp of its source
+    ids: list[tuple[int, int]] = []
+    records: list[bytes] = []
+    offset = 0
+    for rule in sorted(rules, key=lambda rule: rule.id):
+        strings = [
+            rule.title.encode(),
+            rule.group.encode(),
+            rule.comment.encode(),
+            rule.recurrence.fmt().encode() if rule.recurrence else b"",
+            encode_overrides(rule.overrides) if rule.overrides else b"",
+        ]
+        record = RECORD.pack(
+            rule.id,
+            rule.due_date.toordinal() if rule.due_date else 0,
+            STATUS_CODES[rule.status],
+            *map(len, strings),
+        )
+        ids.append((rule.id, offset))
+        records.append(record + b"".join(strings))
+        offset += len(records[-1])
+
+    start = HEADER.size + len(ids) * ID_ENTRY.size
+    header = HEADER.pack(MAGIC, VERSION, *stamp, len(ids))
+    table = b"".join(ID_ENTRY.pack(id, start + offset) for id, offset in ids)
+    return header + table + b"".join(records)
+
+
+def encode_overrides(overrides: dict[datetime.date, Status]) -> bytes:
+    return json.dumps(
+        {day.isoformat(): status.value for day, status in overrides.items()}
+    ).encode()
+
+
+def decode_overrides(text: str) -> dict[datetime.date, Status]:
+    return {
+        datetime.date.fromisoformat(day): Status(status)
+        for day, status in json.loads(text).items()
+    }
@@ -0,0 +1,435 @@
+from __future__ import annotations
+import datetime
+import heapq
+import itertools
+import json
+import re
+import sqlite3
+from pathlib import Path
+from typing import Iterable, Iterator
+
+from .groups import GroupTree, Summary
+from .manager import DATA_PATH, Manager
+from .parser import parse_date
+from .query import Query, compile_query
+from .rule import STATUSES, TodoRule, decode_date
+from .search import TITLE_WEIGHT, SearchIndex, tokenize
+from .storage import Store
+from .utils import today
+
+
+SQLITE_PATH = DATA_PATH.with_suffix(".sqlite3")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS rules (
+    id INTEGER PRIMARY KEY,
+    title TEXT NOT NULL,
+    "group" TEXT NOT NULL,
+    due_date TEXT,
+    comment TEXT NOT NULL,
+    status TEXT NOT NULL,
+    recurrence TEXT,
+    overrides TEXT
+);
+CREATE INDEX IF NOT EXISTS rules_status_due_date ON rules (status, due_date);
+CREATE INDEX IF NOT EXISTS rules_due_date ON rules (due_date);
+CREATE INDEX IF NOT EXISTS rules_group ON rules ("group");
+"""
+
+# Full-text index kept in sync with the rules table by triggers
+SEARCH_SCHEMA = """
+CREATE VIRTUAL TABLE rules_fts USING fts5(
+    title, "group", comment, content='rules', content_rowid='id'
+);
+CREATE TRIGGER rules_fts_insert AFTER INSERT ON rules BEGIN
+    INSERT INTO rules_fts (rowid, title, "group", comment)
+    VALUES (new.id, new.title, new."group", new.comment);
+END;
+CREATE TRIGGER rules_fts_delete AFTER DELETE ON rules BEGIN
+    INSERT INTO rules_fts (rules_fts, rowid, title, "group", comment)
+    VALUES ('delete', old.id, old.title, old."group", old.comment);
+END;
+CREATE TRIGGER rules_fts_update AFTER UPDATE OF title, "group", comment ON rules
+BEGIN
+    INSERT INTO rules_fts (rules_fts, rowid, title, "group", comment)
+    VALUES ('delete', old.id, old.title, old."group", old.comment);
+    INSERT INTO rules_fts (rowid, title, "group", comment)
+    VALUES (new.id, new.title, new."group", new.comment);
+END;
+INSERT INTO rules_fts (rules_fts) VALUES ('rebuild');
+"""
+
+FIELDS = [
+    "id",
+    "title",
+    "group",
+    "due_date",
+    "comment",
+    "status",
+    "recurrence",
+    "overrides",
+]
+COLUMNS = ", ".join(f'"{field}"' for field in FIELDS)
+PLACEHOLDERS = ", ".join("?" for _ in FIELDS)
+# Columns added after the first release, missing from older databases
+ADDED_COLUMNS = ["recurrence", "overrides"]
+
+
+class SqliteManager:
+    path: Path
+    conn: sqlite3.Connection
+    fts: bool  # whether SQLite has FTS5, otherwise searches scan every TODO
+
+    def __init__(self, path: Path | None = None) -> None:
+        self.path = path or SQLITE_PATH
+        exists = self.path.exists()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        self.conn = sqlite3.connect(self.path)
+        self.conn.executescript(SCHEMA)
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(rules)")]
+        for column in ADDED_COLUMNS:
+            if column not in columns:
+                self.conn.execute(f"ALTER TABLE rules ADD COLUMN {column} TEXT")
+        self.fts = self._create_search_index()
+        if not exists and path is None and Store(DATA_PATH).exists():
+            # first run after switching backends
+            self.import_yaml(DATA_PATH)
+            self.save()
+
+    def __enter__(self) -> SqliteManager:
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        if exc_info[0] is None:
+            self.save()
+        else:
+            self.discard()
+
+    @property
+    def dirty(self) -> bool:
+        return self.conn.in_transaction
+
+    @property
+    def next_id(self) -> int:
+        (max_id,) = self.conn.execute("SELECT max(id) FROM rules").fetchone()
+        return (max_id or 0) + 1
+
+    def instances(self, date: str | None, status: str) -> list[TodoRule]:
+        return list(self.iter_instances(date, status))
+
+    def iter_instances(
+        self,
+        date: str | None,
+        status: str,
+        limit: int | None = None,
+        offset: int = 0,
+    ) -> Iterator[TodoRule]:
+        order = "ASC" if status == "uncompleted" else "DESC"
+        if date:
+            day = parse_date(date)
+            single = self._iter(
+                "WHERE status = ? AND due_date = ? AND recurrence IS NULL"
+                f" ORDER BY id {order}",
+                (status, day.isoformat()),
+            )
+            # occurrences of the series which began by then, expanded here
+            series = self._iter(
+                "WHERE recurrence IS NOT NULL AND due_date <= ?", (day.isoformat(),)
+            )
+            occurrences = sorted(
+                itertools.chain.from_iterable(
+                    rule.iter_occurrences(status, day, day) for rule in series
+                ),
+                key=lambda rule: rule.id,
+                reverse=order == "DESC",
+            )
+            rules = heapq.merge(
+                single,
+                occurrences,
+                key=lambda rule: rule.id,
+                reverse=order == "DESC",
+            )
+        else:
+            without_date = self._iter(
+                "WHERE status = ? AND due_date IS NULL ORDER BY id", (status,)
+            )
+            with_date = self._iter(
+                "WHERE status = ? AND due_date IS NOT NULL"
+                f" ORDER BY due_date {order}, id {order}",
+                (status,),
+            )
+            rules = itertools.chain(without_date, with_date)
+
+        # cursors are consumed lazily, so rows after the page are never read
+        stop = None if limit is None else offset + limit
+        return itertools.islice(rules, offset, stop)
+
+    def iter_query(
+        self,
+        expr: str,
+        status: str,
+        limit: int | None = None,
+        offset: int = 0,
+    ) -> Iterator[TodoRule]:
+        query = compile_query(expr, status)
+        rules = itertools.chain.from_iterable(
+            self._plan(query, each) for each in query.statuses
+        )
+        stop = None if limit is None else offset + limit
+        return itertools.islice(filter(query.matches, rules), offset, stop)
+
+    def iter_rules(self) -> Iterator[TodoRule]:
+        return self._iter("ORDER BY id", ())
+
+    def search(self, query: str, limit: int | None = None) -> list[TodoRule]:
+        if not self.fts:
+            index = SearchIndex()
+            for rule in self.iter_rules():
+                index.add(rule)
+            return [self.info(id) for id, _ in index.search(query, limit)]
+
+        terms = tokenize(query)
+        if not terms:
+            return []
+        columns = ", ".join(f'rules."{field}"' for field in FIELDS)
+        cur = self.conn.execute(
+            f"SELECT {columns} FROM rules JOIN rules_fts ON rules_fts.rowid = rules.id"
+            " WHERE rules_fts MATCH ?"
+            f" ORDER BY bm25(rules_fts, {TITLE_WEIGHT}, 1, 1), rules.id LIMIT ?",
+            (
+                " OR ".join(f'"{term}"' for term in terms),
+                -1 if limit is None else limit,
+            ),
+        )
+        return list(map(row_to_rule, cur))
+
+    def groups(self) -> list[Summary]:
+        # Aggregated by SQLite, down to a row per group, status and overdue
+        # date; series are expanded here
+        tree = GroupTree()
+        cur = self.conn.execute(
+            'SELECT "group", status, CASE WHEN status = ? AND due_date < ?'
+            " THEN due_date END AS overdue, count(*) FROM rules"
+            " WHERE recurrence IS NULL GROUP BY 1, 2, 3",
+            ("uncompleted", today().isoformat()),
+        )
+        for group, status, overdue, n in cur:
+            tree.tally(group, status, decode_date(overdue), n)
+        for rule in self._iter("WHERE recurrence IS NOT NULL", ()):
+            tree.add(rule)
+        return tree.summary(today())
+
+    def info(self, id: int) -> TodoRule:
+        rules = self._select("WHERE id = ?", (id,))
+        if not rules:
+            raise KeyError(f"ID not found: {id}")
+        return rules[0]
+
+    def refresh(self) -> None:
+        # every query already sees what other processes committed
+        pass
+
+    def save(self) -> None:
+        if self.dirty:
+            self.conn.commit()
+
+    def discard(self) -> None:
+        if self.dirty:
+            self.conn.rollback()
+
+    def append(self, rule: TodoRule) -> int:
+        rule.id = self.next_id
+        self.conn.execute(
+            f"INSERT INTO rules ({COLUMNS}) VALUES ({PLACEHOLDERS})",
+            rule_to_row(rule),
+        )
+        return rule.id
+
+    def extend(self, rules: Iterable[TodoRule]) -> list[int]:
+        ids: list[int] = []
+        next_id = self.next_id
+
+        def rows():
+            for i, rule in enumerate(rules, start=next_id):
+                rule.id = i
+                ids.append(i)
+                yield rule_to_row(rule)
+
+        self.conn.executemany(
+            f"INSERT INTO rules ({COLUMNS}) VALUES ({PLACEHOLDERS})", rows()
+        )
+        return ids
+
+    def update(self, id: int, rule: TodoRule):
+        rule.id = id
+        old = self.info(id)
+        if rule.overrides is None:
+            rule.inherit_overrides(old)
+        if old.into_dict() == rule.into_dict():
+            # no write, and no transaction to commit
+            return
+        assignments = ", ".join(f'"{field}" = ?' for field in FIELDS[1:])
+        cur = self.conn.execute(
+            f"UPDATE rules SET {assignments} WHERE id = ?",
+            rule_to_row(rule)[1:] + (id,),
+        )
+        if cur.rowcount == 0:
+            raise KeyError(f"ID not found: {id}")
+
+    def mark(self, id: int, status: str, date: datetime.date | None = None):
+        if status not in STATUSES:
+            raise ValueError(f"Unknown status: {status}")
+        rule = self.info(id)
+        if date is None:
+            rule.set_status(status)
+        else:
+            rule.set_override(date, status)
+        row = dict(zip(FIELDS, rule_to_row(rule)))
+        self.conn.execute(
+            "UPDATE rules SET status = ?, overrides = ? WHERE id = ?",
+            (row["status"], row["overrides"], id),
+        )
+
+    def remove(self, id: int):
+        cur = self.conn.execute("DELETE FROM rules WHERE id = ?", (id,))
+        if cur.rowcount == 0:
+            raise KeyError(f"ID not found: {id}")
+
+    def archive(self, before: datetime.date) -> int:
+        # Queries only read the rows they need already
+        raise ValueError("Archiving is only supported by the yaml backend")
+
+    def import_yaml(self, path: Path) -> None:
+        source = Manager(path)
+        # an upsert rather than INSERT OR REPLACE, whose deletions don't fire
+        # the triggers of the search index
+        assignments = ", ".join(f'"{field}" = excluded."{field}"' for field in FIELDS)
+        self.conn.executemany(
+            f"INSERT INTO rules ({COLUMNS}) VALUES ({PLACEHOLDERS})"
+            f" ON CONFLICT (id) DO UPDATE SET {assignments}",
+            map(rule_to_row, source.iter_rules()),
+        )
+
+    def export_yaml(self, path: Path) -> None:
+        target = Manager(path)
+        target.data = {rule.id: rule for rule in self.iter_rules()}
+        target.compact()
+
+    def _create_search_index(self) -> bool:
+        (exists,) = self.conn.execute(
+            "SELECT count(*) FROM sqlite_master WHERE name = 'rules_fts'"
+        ).fetchone()
+        if exists:
+            return True
+        try:
+            self.conn.executescript(SEARCH_SCHEMA)
+        except sqlite3.OperationalError:
+            # built without FTS5
+            return False
+        return True
+
+    def _plan(self, query: Query, status: str) -> Iterator[TodoRule]:
+        # Candidates of the status, narrowed by the indexed columns. The
+        # predicates of the query still have to be checked on them.
+        if query.is_empty():
+            return iter(())
+
+        groups = []
+        group_params = []
+        for pattern in query.groups:
+            if pattern.endswith("*"):
+                prefix = re.sub(r"([\\%_])", r"\\\1", pattern[:-1])
+                groups.append("\"group\" LIKE ? ESCAPE '\\'")
+                group_params.append(prefix + "%")
+            else:
+                groups.append('"group" = ?')
+                group_params.append(pattern)
+        narrowing = f" AND ({' OR '.join(groups)})" if groups else ""
+
+        order = "ASC" if status == "uncompleted" else "DESC"
+        if query.start or query.end:
+            # open-ended windows by ascending due date, like Manager
+            if query.end is None:
+                order = "ASC"
+            bounds = ""
+            bound_params = []
+            if query.start:
+                bounds += " AND due_date >= ?"
+                bound_params.append(query.start.isoformat())
+            if query.end:
+                bounds += " AND due_date <= ?"
+                bound_params.append(query.end.isoformat())
+            single = self._iter(
+                f"WHERE status = ? AND recurrence IS NULL{bounds}{narrowing}"
+                f" ORDER BY due_date {order}, id {order}",
+                (status, *bound_params, *group_params),
+            )
+            # occurrences may have another status than their series
+            began = ""
+            began_params = []
+            if query.end:
+                began = " AND due_date <= ?"
+                began_params.append(query.end.isoformat())
+            series = self._select(
+                f"WHERE recurrence IS NOT NULL{began}{narrowing}",
+                (*began_params, *group_params),
+            )
+            # without an end, each series at its next occurrence only
+            occurrences = [
+                itertools.islice(
+                    rule.iter_occurrences(status, query.start, query.end),
+                    None if query.end else 1,
+                )
+                for rule in series
+            ]
+            if order == "DESC":
+                occurrences = [reversed(list(each)) for each in occurrences]
+            return heapq.merge(
+                single,
+                *occurrences,
+                key=lambda rule: (rule.due_date, rule.id),
+                reverse=order == "DESC",
+            )
+
+        without_date = self._iter(
+            f"WHERE status = ? AND due_date IS NULL{narrowing} ORDER BY id",
+            (status, *group_params),
+        )
+        with_date = self._iter(
+            f"WHERE status = ? AND due_date IS NOT NULL{narrowing}"
+            f" ORDER BY due_date {order}, id {order}",
+            (status, *group_params),
+        )
+        if query.dated:
+            return with_date
+        if query.dated is False:
+            return without_date
+        return itertools.chain(without_date, with_date)
+
+    def _select(self, clause: str, params: tuple) -> list[TodoRule]:
+        return list(self._iter(clause, params))
+
+    def _iter(self, clause: str, params: tuple) -> Iterator[TodoRule]:
+        cur = self.conn.execute(f"SELECT {COLUMNS} FROM rules {clause}", params)
+        return map(row_to_rule, cur)
+
+
+def rule_to_row(rule: TodoRule) -> tuple:
+    return (
+        rule.id,
+        rule.title,
+        rule.group,
+        rule.due_date.isoformat() if rule.due_date else None,
+        rule.comment,
+        rule.status.value,
+        rule.recurrence.fmt() if rule.recurrence else None,
+        json.dumps(rule.into_dict()["overrides"]) if rule.overrides else None,
+    )
+
+
+def row_to_rule(row: tuple) -> TodoRule:
+    record = dict(zip(FIELDS, row))
+    if record["overrides"]:
+        record["overrides"] = json.loads(record["overrides"])
+    return TodoRule.from_record(record)
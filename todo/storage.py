@@ -0,0 +1,376 @@
+import contextlib
+import datetime
+import json
+import logging
+import os
+import time
+from pathlib import Path
+from typing import BinaryIO, Iterable, Iterator, TextIO
+import yaml
+
+from .groups import GroupTree, read_groups, write_groups
+from .rule import STATUSES, TodoRule
+from .search import IndexFile, read_index, write_index
+from .snapshot import Snapshot, read_snapshot, write_snapshot
+from .utils import atomic_write, file_stamp
+
+try:
+    import fcntl
+except ImportError:
+    # not available on Windows, where concurrent invocations aren't guarded
+    fcntl = None
+
+try:
+    # libyaml bindings, much faster than the pure Python implementation
+    from yaml import CSafeDumper as Dumper, CSafeLoader as Loader
+except ImportError:
+    from yaml import SafeDumper as Dumper, SafeLoader as Loader
+
+
+logger = logging.getLogger(__name__)
+
+# Number of journal records after which the journal is folded into the snapshot
+JOURNAL_LIMIT = 1000
+
+# Archive shard of the TODOs without a due date; the others are by month
+UNDATED_SHARD = "undated"
+# Archive shard of the recurring TODOs, whose occurrences span many months
+SERIES_SHARD = "series"
+
+# Type of every field of a record. Fields in OPTIONAL_FIELDS may be missing.
+SCHEMA: dict[str, type | tuple[type, ...]] = {
+    "id": int,
+    "title": str,
+    "group": str,
+    # hand-written dates are loaded as datetime.date
+    "due_date": (str, datetime.date),
+    "comment": str,
+    "status": str,
+    "recurrence": str,
+    "overrides": dict,  # by ISO date
+}
+OPTIONAL_FIELDS = ["status", "recurrence", "overrides"]
+
+
+class Archive:
+    # Cold shards of finished TODOs moved out of the data file, only read when
+    # a command may show them: a YAML file per month of due date, one for the
+    # TODOs without a due date and one for recurring TODOs, which every dated
+    # query reads. The manifest lists the ids of every shard
+    # and the largest id ever archived, which new TODOs must not reuse.
+    # Whenever a TODO is found in both, the data file wins.
+    path: Path
+    manifest_path: Path
+    loader: type
+    dumper: type
+    max_id: int
+    shards: dict[str, list[int]]  # name -> ids
+    ids: dict[int, str] | None  # id -> name, built on the first lookup
+
+    def __init__(self, path: Path, loader: type, dumper: type) -> None:
+        self.path = path
+        self.manifest_path = path / "manifest.json"
+        self.loader = loader
+        self.dumper = dumper
+        self.max_id = 0
+        self.shards = {}
+        self.ids = None
+
+    def read_manifest(self) -> None:
+        try:
+            with self.manifest_path.open("r") as f:
+                manifest = json.load(f)
+        except FileNotFoundError:
+            manifest = {"max_id": 0, "shards": {}}
+        self.max_id = manifest["max_id"]
+        self.shards = manifest["shards"]
+        self.ids = None
+
+    def find(self, id: int) -> str | None:
+        # Name of the shard holding the TODO, if any
+        if self.ids is None:
+            self.ids = {id: name for name, ids in self.shards.items() for id in ids}
+        return self.ids.get(id)
+
+    def select(
+        self,
+        start: datetime.date | None = None,
+        end: datetime.date | None = None,
+        dated: bool | None = None,
+    ) -> list[str]:
+        # Shards which may hold TODOs due between `start` and `end`, both
+        # inclusive, or without a due date unless `dated` is set
+        names = []
+        for name in self.shards:
+            if name == UNDATED_SHARD:
+                if not (dated or start or end):
+                    names.append(name)
+            elif name == SERIES_SHARD:
+                if dated is not False:
+                    names.append(name)
+            elif not (
+                dated is False
+                or start
+                and name < start.strftime("%Y-%m")
+                or end
+                and name > end.strftime("%Y-%m")
+            ):
+                names.append(name)
+        return sorted(names)
+
+    def shard_path(self, name: str) -> Path:
+        return self.path / f"{name}.yaml"
+
+    def load(self, name: str) -> list[dict]:
+        return read_records(self.shard_path(name), self.loader)
+
+    def add(self, rules: Iterable[TodoRule]) -> None:
+        # Must be called with the store locked, like the two methods below
+        by_shard: dict[str, list[TodoRule]] = {}
+        for rule in rules:
+            by_shard.setdefault(shard_name(rule), []).append(rule)
+            self.max_id = max(self.max_id, rule.id)
+        for name, added in by_shard.items():
+            records = {record["id"]: record for record in self._load_if_any(name)}
+            records.update((rule.id, rule.into_dict()) for rule in added)
+            self._write(name, records)
+        self._write_manifest()
+
+    def discard(self, ids: Iterable[int]) -> None:
+        by_shard: dict[str, set[int]] = {}
+        for id in ids:
+            name = self.find(id)
+            if name is not None:
+                by_shard.setdefault(name, set()).add(id)
+        for name, discarded in by_shard.items():
+            records = {
+                record["id"]: record
+                for record in self._load_if_any(name)
+                if record["id"] not in discarded
+            }
+            self._write(name, records)
+        if by_shard:
+            self._write_manifest()
+
+    def _load_if_any(self, name: str) -> list[dict]:
+        if name not in self.shards:
+            return []
+        return self.load(name)
+
+    def _write(self, name: str, records: dict[int, dict]) -> None:
+        path = self.shard_path(name)
+        if not records:
+            path.unlink(missing_ok=True)
+            self.shards.pop(name, None)
+        else:
+            self.path.mkdir(parents=True, exist_ok=True)
+            rows = [records[id] for id in sorted(records)]
+            atomic_write(path, yaml.dump(rows, Dumper=self.dumper).encode())
+            self.shards[name] = sorted(records)
+        self.ids = None
+
+    def _write_manifest(self) -> None:
+        # last, so that a crash before leaves shards holding more than it says
+        manifest = {"max_id": self.max_id, "shards": self.shards}
+        atomic_write(self.manifest_path, json.dumps(manifest).encode())
+
+
+class Store:
+    path: Path
+    journal_path: Path
+    binary_path: Path
+    index_path: Path
+    groups_path: Path
+    lock_path: Path
+    archive: Archive
+    lock_wait: float  # total seconds spent waiting for the lock
+    loader: type = Loader
+    dumper: type = Dumper
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.journal_path = path.with_suffix(".journal")
+        self.binary_path = path.with_suffix(".bin")
+        self.index_path = path.with_suffix(".index")
+        self.groups_path = path.with_suffix(".groups")
+        self.lock_path = path.with_suffix(".lock")
+        self.lock_wait = 0.0
+        self.archive = Archive(path.with_suffix(".archive"), self.loader, self.dumper)
+
+    def exists(self) -> bool:
+        return self.path.exists() or self.journal_path.exists()
+
+    def version(self) -> tuple:
+        # Changes whenever the store is written
+        return (stat_key(self.path), stat_key(self.journal_path))
+
+    @contextlib.contextmanager
+    def lock(self, shared: bool = False) -> Iterator[None]:
+        # Advisory lock held while reading (shared) or writing (exclusive)
+        if fcntl is None or (shared and not self.path.parent.exists()):
+            yield
+            return
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self.lock_path.open("a") as f:
+            start = time.perf_counter()
+            fcntl.flock(f, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            waited = time.perf_counter() - start
+            self.lock_wait += waited
+            logger.debug(
+                "waited %.3fs for the %s lock on %s",
+                waited,
+                "shared" if shared else "exclusive",
+                self.lock_path,
+            )
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def load_snapshot(self) -> list[dict]:
+        return read_records(self.path, self.loader)
+
+    def read_binary(self, mapped: bool = False) -> Snapshot | None:
+        # The binary copy of the snapshot, or None if it is missing or stale
+        if not self.path.exists():
+            return None
+        return read_snapshot(self.binary_path, self.path, mapped)
+
+    def write_binary(self, rules: Iterable[TodoRule]) -> None:
+        write_snapshot(self.binary_path, self.path, rules)
+
+    def read_index(self) -> IndexFile | None:
+        # The search index built along the current snapshot, if any
+        if not self.path.exists():
+            return None
+        return read_index(self.index_path, self.path)
+
+    def write_index(self, rules: Iterable[TodoRule]) -> None:
+        write_index(self.index_path, self.path, rules)
+
+    def read_groups(self) -> GroupTree | None:
+        # The group aggregates of the current snapshot, if any
+        if not self.path.exists():
+            return None
+        return read_groups(self.groups_path, self.path)
+
+    def write_groups(self, tree: GroupTree) -> None:
+        write_groups(self.groups_path, self.path, tree)
+
+    def load_journal(self) -> list[dict]:
+        if not self.journal_path.exists():
+            return []
+
+        ops: list[dict] = []
+        with self.journal_path.open("r") as f:
+            for line in f:
+                try:
+                    ops.append(json.loads(line))
+                except json.JSONDecodeError:
+                    # a torn record left by an interrupted write
+                    break
+        return ops
+
+    def append(self, ops: list[dict]) -> None:
+        if not ops:
+            return
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        lines = "".join(json.dumps(encode_op(op)) + "\n" for op in ops)
+        with self.journal_path.open("a+b") as f:
+            cut_torn_record(f)
+            f.write(lines.encode())
+            f.flush()
+            os.fsync(f.fileno())
+
+    def compact(self, rules: list[TodoRule]) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        text = yaml.dump([rule.into_dict() for rule in rules], Dumper=self.dumper)
+        atomic_write(self.path, text.encode())
+        self.write_binary(rules)
+        self.write_groups(GroupTree(rules))
+
+        # Replaying the journal is idempotent, so a crash before this line only
+        # leaves redundant records behind.
+        self.journal_path.unlink(missing_ok=True)
+
+
+def cut_torn_record(f: BinaryIO) -> None:
+    # Truncates the journal after its last complete record. A torn one, left
+    # by an interrupted write, is skipped by load_journal along with every
+    # record appended to it.
+    end = pos = f.seek(0, os.SEEK_END)
+    while pos > 0:
+        start = max(0, pos - 4096)
+        f.seek(start)
+        block = f.read(pos - start)
+        i = block.rfind(b"\n")
+        if i != -1:
+            pos = start + i + 1
+            break
+        pos = start
+    if pos != end:
+        logger.warning("dropped a torn record of %s", f.name)
+        f.truncate(pos)
+
+
+def shard_name(rule: TodoRule) -> str:
+    if rule.due_date is None:
+        return UNDATED_SHARD
+    if rule.recurrence is not None:
+        return SERIES_SHARD
+    return rule.due_date.strftime("%Y-%m")
+
+
+def read_records(path: Path, loader: type) -> list[dict]:
+    if not path.exists():
+        return []
+    with path.open("r") as f:
+        return parse_records(f, loader, path)
+
+
+def parse_records(stream: str | TextIO, loader: type, path: Path) -> list[dict]:
+    # `path` names the source in errors
+    try:
+        records = yaml.load(stream, loader)
+    except yaml.YAMLError as e:
+        raise ValueError(f"{path}: {e}") from e
+    if records is None:
+        return []
+    if not isinstance(records, list):
+        raise ValueError(f"{path}: expected a list of TODOs")
+    for record in records:
+        validate(record)
+    return records
+
+
+def stat_key(path: Path) -> tuple[int, int, int] | None:
+    try:
+        return file_stamp(path)
+    except FileNotFoundError:
+        return None
+
+
+def encode_op(op: dict) -> dict:
+    # Pending journal records hold the TodoRule itself
+    rule = op.get("rule")
+    if isinstance(rule, TodoRule):
+        return op | {"rule": rule.into_dict()}
+    return op
+
+
+def validate(record: dict) -> None:
+    if not isinstance(record, dict):
+        raise ValueError(f"Invalid record: {record!r}")
+    for field, value in record.items():
+        if field not in SCHEMA:
+            raise ValueError(f"Unknown field in record: {field}")
+        if not isinstance(value, SCHEMA[field]) or isinstance(value, bool):
+            raise ValueError(f"Invalid {field} in record: {value!r}")
+    for field in SCHEMA:
+        if field not in record and field not in OPTIONAL_FIELDS:
+            raise ValueError(f"Missing {field} in record: {record!r}")
+    if record.get("status", "uncompleted") not in STATUSES:
+        raise ValueError(f"Unknown status: {record['status']}")
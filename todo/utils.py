@@ -1,8 +1,93 @@
 import datetime
+import functools
+import itertools
+import os
+import tempfile
+from pathlib import Path
+from typing import Callable, Iterable, Iterator, TypeVar
 
 
-def date_to_relative(date: datetime.date) -> str:
-    today = datetime.date.today()
+T = TypeVar("T")
+R = TypeVar("R")
+
+_frozen_today: datetime.date | None = None
+
+
+def today() -> datetime.date:
+    return _frozen_today or datetime.date.today()
+
+
+def freeze_today(date: datetime.date | None) -> None:
+    # Pins the result of today(), so that one invocation sees a single date
+    # even if it runs across midnight. None releases it.
+    global _frozen_today
+    _frozen_today = date
+
+
+def daily_cache(
+    maxsize: int = 1024,
+) -> Callable[[Callable[[T, datetime.date], R]], Callable[[T], R]]:
+    # Memoizes func(arg, today()) as a function of arg. Entries are dropped
+    # (and the hit/miss counters reset) when the day changes.
+    def decorator(func: Callable[[T, datetime.date], R]) -> Callable[[T], R]:
+        cached = functools.lru_cache(maxsize)(func)
+        last_day: datetime.date | None = None
+
+        @functools.wraps(func)
+        def wrapper(arg: T) -> R:
+            nonlocal last_day
+            day = today()
+            if day != last_day:
+                cached.cache_clear()
+                last_day = day
+            return cached(arg, day)
+
+        wrapper.cache_info = cached.cache_info  # type: ignore
+        wrapper.cache_clear = cached.cache_clear  # type: ignore
+        return wrapper
+
+    return decorator
+
+
+def atomic_write(path: Path, data: bytes) -> None:
+    # Either the old or the new content is found at `path`, even if the
+    # process or the machine crashes in the middle.
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+    if hasattr(os, "O_DIRECTORY"):
+        # persist the rename itself
+        dir_fd = os.open(path.parent, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+
+def file_stamp(path: Path) -> tuple[int, int, int]:
+    # Changes whenever the file does. Files written by atomic_write get a new
+    # inode each time, which tells them apart even when the size and the
+    # coarse mtime of some filesystems stay the same.
+    stat = path.stat()
+    return (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+
+def chunked(iterable: Iterable[T], size: int) -> Iterator[list[T]]:
+    it = iter(iterable)
+    while chunk := list(itertools.islice(it, size)):
+        yield chunk
+
+
+@daily_cache()
+def date_to_relative(date: datetime.date, today: datetime.date) -> str:
     if date == today:
         return "today"
     elif (date - today).days == 1: